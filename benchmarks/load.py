@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Log in many users at once against the local todoist stand-in")
+    parser.add_argument("--sessions", type=int, default=50, help="Number of simultaneous logins")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the stand-in started by this command")
+    parser.add_argument("--tasks", type=int, default=10000, help="Number of tasks of each user")
+    parser.add_argument("--latency", type=float, default=0.05, help="Average seconds added to every response")
+    parser.add_argument("--rate-limit", type=float, default=0.01, help="Share of responses that are 429")
+    parser.add_argument("--errors", type=float, default=0.01, help="Share of responses that are 5xx errors")
+    parser.add_argument("--truncate", type=float, default=0.0, help="Share of completed pages cut short")
+    args = parser.parse_args()
+
+    # The collector reads the urls and the cache folder when it is imported
+    url = f"http://127.0.0.1:{args.port}"
+    os.environ["TODOIST_API_URL"] = url
+    os.environ["TODOIST_AUTH_URL"] = url
+    os.environ.setdefault("CACHE_DIR", os.path.join(tempfile.gettempdir(), "task-analytics-load"))
+    from src import transport
+    from src.data import DataCollector
+    from src.session import get_token
+    from benchmarks.server import StandIn, serve
+
+    stand_in = StandIn(args.tasks, args.sessions, args.latency, args.rate_limit, 1, args.errors, args.truncate)
+    server = serve(stand_in, port=args.port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def session(i):
+        # Login, first render (active tasks) and the whole completed history, like a visit to the app
+        start = time.perf_counter()
+        token = asyncio.run(get_token(f"load-{i}"))
+        collector = DataCollector(token, use_cache=False)
+        first_render = time.perf_counter() - start
+        collector.collect_all_items()
+        return first_render, time.perf_counter() - start, collector.completed_count, collector.user["completed_count"]
+
+    # Generate the users before timing so only the collector is measured
+    for i in range(args.sessions):
+        stand_in.workload(f"load-{i}")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        results = list(executor.map(session, range(args.sessions)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    first_renders = sorted(result[0] for result in results)
+    totals = sorted(result[1] for result in results)
+    incomplete = sum(1 for result in results if result[2] < result[3])
+    print(f"{args.sessions} sessions in {elapsed:.1f}s with {transport.max_connections} connections per process")
+    print(f"First render: median {first_renders[len(results) // 2]:.2f}s, slowest {first_renders[-1]:.2f}s")
+    print(f"Whole history: median {totals[len(results) // 2]:.2f}s, slowest {totals[-1]:.2f}s")
+    print(f"Sessions with missing completed tasks: {incomplete}")
+    return 1 if incomplete else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
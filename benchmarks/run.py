@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+from datetime import date
+
+# The benchmark never touches the cache of the app or opens windows to plot
+os.environ.setdefault("CACHE_DIR", os.path.join(tempfile.gettempdir(), "task-analytics-benchmark"))
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import pandas as pd
+from src import transport, plots
+from src.data import DataCollector
+from src.store import TaskStore
+from src.aggregates import TaskCube
+from benchmarks.workload import Workload
+
+# Sizes of the synthetic users and where their timings are kept
+SIZES = [1000, 10000, 100000, 1000000]
+baseline_path = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+class Response:
+    # Enough of a requests response for the collector
+    def __init__(self, data, status_code=200):
+        self.status_code = status_code
+        self.text = json.dumps(data)
+
+    def iter_content(self, chunk_size=1):
+        body = self.text.encode()
+        return (body[i:i + chunk_size] for i in range(0, len(body), chunk_size))
+
+
+@contextlib.contextmanager
+def serve(workload):
+    # Answer the requests of the collector from the workload instead of todoist
+    def get(url, params=None, parse=None, **kwargs):
+        params = params or {}
+        if url.endswith("/sync"):
+            resp = Response(workload.sync())
+        else:
+            resp = Response(workload.completed_page(params.get("limit", 200), params.get("offset", 0),
+                                                    params.get("since"), params.get("until")))
+        if parse is not None:
+            resp.data = parse(resp)
+        return resp
+
+    original = transport.get
+    transport.get = get
+    try:
+        yield
+    finally:
+        transport.get = original
+
+
+def ingest():
+    # Full sync and the whole completed history, as loaded in the background by the app
+    collector = DataCollector("benchmark", use_cache=False)
+    collector.collect_all_items()
+    return collector
+
+
+def homepage(cube):
+    today = date.today()
+    return (cube.totals(), cube.totals(completed=True), cube.totals(active=True, due=True),
+            cube.category_counts("project_name"), cube.category_counts("priority", active=True),
+            cube.daily("completed", period="year", anchor_date=today),
+            cube.daily("due", period="year", anchor_date=today))
+
+
+def habits(cube):
+    anchor_date = cube.daily("completed").index.max()
+    counts = [(cube.count(period=period, anchor_date=anchor_date),
+               cube.count(habit=True, period=period, anchor_date=anchor_date),
+               cube.daily(period=period, anchor_date=anchor_date)) for period in ["week", "month", "quarter"]]
+    return counts, cube.habits.habits()
+
+
+def productivity(tasks):
+    counts = tasks.counts
+    active = tasks.select(["added_at", "project_name", "labels", "content", "task_id"],
+                          rows=tasks.column("added_at").notna() & tasks.column("due_date").isna() &
+                          ~tasks.column("recurring"))
+    active["age_in_days"] = (date.today() - active["added_at"].dt.date).dt.days
+    return (counts.per_day(), counts.per_week(), counts.day_velocity(), counts.week_velocity(),
+            tasks.work_in_progress(), active.nsmallest(10, "added_at"))
+
+
+def planning(tasks):
+    columns = ["task_id", "content", "project_name", "priority", "added_at", "completed_at", "due_date"]
+    completed = tasks.slice("week", date.today(), "completed_at", columns)
+    due = tasks.slice("week", date.today(), "due_date", columns)
+    week_tasks = pd.concat([completed, due[due["completed_at"].isna()]])
+    week_tasks["date"] = week_tasks["completed_at"].where(week_tasks["completed_at"].notna(), week_tasks["due_date"])
+    days = list(week_tasks.groupby(week_tasks["date"].dt.date, sort=False))
+    suggestions = tasks.select(["task_id", "content", "priority", "added_at"],
+                               rows=tasks.column("completed_at").isna() & tasks.column("due_date").isna())
+    suggestions["priority_key"] = -suggestions["priority"].cat.codes
+    return days, suggestions.nsmallest(35, ["priority_key", "added_at"])
+
+
+def render_plots(cube):
+    # Figures are rendered again every time, as the first visit of a session would do
+    per_day = cube.daily("completed")
+    of_year = cube.daily("completed", period="year", anchor_date=per_day.index.max())
+    plots._render_cache.clear()
+    return (plots.plot_image(plots.plot_with_average, per_day, x_label="Date", y_label="# Tasks", labelrotation=30,
+                             x_tick_interval=30),
+            plots.plot_image(plots.heatmap_plot, of_year),
+            plots.plot_image(plots.category_pie, cube.category_counts("project_name")))
+
+
+def timed(function, *args, repeat=1):
+    # Best time of a few runs and the result of the last one
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark(size, repeat=3):
+    timings = {}
+    start = time.perf_counter()
+    workload = Workload(size)
+    timings["generate"] = time.perf_counter() - start
+
+    with serve(workload):
+        timings["ingest"], collector = timed(ingest)
+    tasks = TaskStore(*collector.snapshot(), start_day=collector.user["start_day"])
+    timings["cube"], cube = timed(TaskCube, tasks.frame, tasks.history, tasks.start_day, tasks.habits, repeat=repeat)
+    timings["homepage"], _ = timed(homepage, cube, repeat=repeat)
+    timings["habits"], _ = timed(habits, cube, repeat=repeat)
+    timings["productivity"], _ = timed(productivity, tasks, repeat=repeat)
+    timings["planning"], _ = timed(planning, tasks, repeat=repeat)
+    timings["plots"], _ = timed(render_plots, cube)
+
+    # Pages reading the tasks through the snapshot shared by the worker processes
+    timings["publish"], published = timed(collector.publish, True)
+    if not isinstance(published[0], pd.DataFrame):
+        mapped = TaskStore(*published, start_day=collector.user["start_day"])
+        timings["productivity_mapped"], _ = timed(productivity, mapped, repeat=repeat)
+        timings["planning_mapped"], _ = timed(planning, mapped, repeat=repeat)
+    timings["memory_mb"] = tasks.frame.memory_usage(deep=True).sum() / 1024 / 1024
+    return timings
+
+
+def compare(results, baseline, tolerance):
+    # Stages slower than the baseline by more than the tolerance
+    regressions = []
+    for size, timings in results.items():
+        label = f"{size} tasks" if size.isdigit() else size
+        if size not in baseline:
+            regressions.append(f"{label}: no baseline, save one with --update")
+            continue
+        for stage, value in timings.items():
+            before = baseline.get(size, {}).get(stage)
+            if stage != "generate" and before and value > before * (1 + tolerance):
+                regressions.append(f"{label}, {stage}: {value:.3f} (baseline {before:.3f})")
+    return regressions
+
+
+def load_baseline(parser, args):
+    # Timings saved with --update, comparing without them is an error instead of finding no regressions
+    if not os.path.exists(args.baseline):
+        if args.update:
+            return {}
+        parser.error(f"no baseline in {args.baseline}, save one on this machine with --update first")
+    with open(args.baseline) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the ingest and the data of every page for synthetic users")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES[:3], help="Number of tasks of each user")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each page, the best one is kept")
+    parser.add_argument("--baseline", default=baseline_path, help="File with the timings to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Slowdown reported as a regression")
+    parser.add_argument("--update", action="store_true", help="Save the timings as the new baseline")
+    args = parser.parse_args()
+    baseline = load_baseline(parser, args)
+
+    # Time every size
+    results = {}
+    for size in args.sizes:
+        results[str(size)] = benchmark(size, args.repeat)
+        print(f"{size:>9,} tasks: " + ", ".join(f"{stage} {value:.3f}"
+                                                for stage, value in results[str(size)].items()))
+
+    # Save or compare with the baseline (memory is reported in MB, everything else in seconds)
+    if args.update:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"Regression in {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
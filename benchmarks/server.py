@@ -0,0 +1,152 @@
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+from benchmarks.workload import Workload
+
+
+class StandIn:
+    # Todoist api answered from synthetic users, with the faults to inject in the responses
+    def __init__(self, tasks=10000, users=100, latency=0.0, rate_limit=0.0, retry_after=1, errors=0.0,
+                 truncate=0.0, redirect_url="http://localhost:8080", seed=0):
+        self.tasks = tasks
+        self.users = users
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.errors = errors
+        self.truncate = truncate
+        self.redirect_url = redirect_url
+        self._random = random.Random(seed)
+        self._workloads = {}
+        self._lock = threading.Lock()
+
+    def workload(self, token):
+        # Each token is one of the synthetic users, generated the first time it is requested
+        seed = int(hashlib.md5(token.encode()).hexdigest(), 16) % self.users
+        with self._lock:
+            if seed not in self._workloads:
+                self._workloads[seed] = Workload(self.tasks, seed=seed)
+            return self._workloads[seed]
+
+    def fault(self):
+        # Status code and headers of an injected fault, or None to answer normally
+        if self.latency > 0:
+            time.sleep(self._random.uniform(0.5, 1.5) * self.latency)
+        if self._random.random() < self.rate_limit:
+            return 429, {"Retry-After": str(self.retry_after)}
+        if self._random.random() < self.errors:
+            return self._random.choice([500, 502, 503]), {}
+        return None
+
+    def truncated(self, page):
+        # Drop the end of a page of completed items
+        if page["items"] and self._random.random() < self.truncate:
+            page["items"] = page["items"][:self._random.randrange(len(page["items"]))]
+        return page
+
+
+class Handler(BaseHTTPRequestHandler):
+    stand_in = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/oauth/authorize":
+            # Authorize right away and go back to the app with a new code
+            code = hashlib.md5(f"{time.time_ns()}{random.random()}".encode()).hexdigest()
+            query = urlencode({"code": code, "state": params.get("state", "")})
+            self._send(302, headers={"Location": f"{self.stand_in.redirect_url}?{query}"})
+            return
+        self._api(url.path, params)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        params = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+        params.update({key: values[0] for key, values in parse_qs(url.query).items()})
+        if url.path == "/oauth/access_token":
+            # Every code is valid and is exchanged for a token of the same name
+            if "code" not in params:
+                self._send(400, {"error": "invalid_grant"})
+            else:
+                self._send(200, {"access_token": params["code"], "token_type": "Bearer"})
+            return
+        self._api(url.path, params)
+
+    def _api(self, path, params):
+        authorization = self.headers.get("Authorization", "")
+        if not authorization.startswith("Bearer "):
+            self._send(401, {"error": "Unauthorized"})
+            return
+        fault = self.stand_in.fault()
+        if fault is not None:
+            self._send(fault[0], {"error": "Injected fault"}, headers=fault[1])
+            return
+
+        workload = self.stand_in.workload(authorization[len("Bearer "):])
+        if path == "/sync/v9/sync":
+            self._send(200, workload.sync())
+        elif path == "/sync/v9/completed/get_all":
+            page = workload.completed_page(int(params.get("limit", 30)), int(params.get("offset", 0)),
+                                           params.get("since"), params.get("until"))
+            self._send(200, self.stand_in.truncated(page))
+        else:
+            self._send(404, {"error": "Not found"})
+
+    def _send(self, status, data=None, headers=None):
+        body = json.dumps(data).encode() if data is not None else b""
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(stand_in, host="127.0.0.1", port=8765):
+    # Server of the stand-in, call serve_forever (or run it in a thread) and shutdown when done
+    handler = type("StandInHandler", (Handler,), {"stand_in": stand_in})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in of the todoist api serving synthetic users")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tasks", type=int, default=10000, help="Number of tasks of each user")
+    parser.add_argument("--users", type=int, default=100, help="Number of different users behind the tokens")
+    parser.add_argument("--latency", type=float, default=0.0, help="Average seconds added to every response")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Share of responses that are 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Seconds to wait after a 429")
+    parser.add_argument("--errors", type=float, default=0.0, help="Share of responses that are 5xx errors")
+    parser.add_argument("--truncate", type=float, default=0.0, help="Share of completed pages cut short")
+    parser.add_argument("--redirect-url", default="http://localhost:8080", help="Url of the app after login")
+    args = parser.parse_args()
+
+    stand_in = StandIn(args.tasks, args.users, args.latency, args.rate_limit, args.retry_after, args.errors,
+                       args.truncate, args.redirect_url)
+    server = serve(stand_in, args.host, args.port)
+    print(f"Serving the todoist stand-in on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
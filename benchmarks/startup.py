@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from benchmarks.run import baseline_path, compare, load_baseline
+
+# Modules imported by each entry point before its first render, and the ones loaded later by the charts
+ENTRY_POINTS = {"homepage": ["streamlit", "src.utils", "src.plots"],
+                "productivity": ["streamlit", "src.utils", "src.plots", "src.forecast"],
+                "charts": ["matplotlib.pyplot", "matplotlib.dates", "july"],
+                "prophet": ["prophet"]}
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile(modules):
+    # Wall time of a new interpreter importing the modules and the cumulative time of each top level import
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+                             cwd=root, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    imports = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            imports[name.strip()] = int(cumulative) / 1e6
+    return elapsed, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the imports of every entry point in a new interpreter")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each entry point, the best one is kept")
+    parser.add_argument("--top", type=int, default=10, help="Slowest top level imports to show")
+    parser.add_argument("--baseline", default=baseline_path, help="File with the timings to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Slowdown reported as a regression")
+    parser.add_argument("--update", action="store_true", help="Save the timings as the new baseline")
+    args = parser.parse_args()
+    baseline = load_baseline(parser, args)
+
+    timings = {}
+    for entry_point, modules in ENTRY_POINTS.items():
+        try:
+            runs = [profile(modules) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{entry_point}: could not be imported ({e})")
+            continue
+        elapsed, imports = min(runs, key=lambda run: run[0])
+        timings[entry_point] = elapsed
+        slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        print(f"{entry_point}: {elapsed:.3f}s (" + ", ".join(f"{name} {seconds:.3f}" for name, seconds in slowest) + ")")
+
+    # Save or compare with the baseline
+    if args.update:
+        baseline["startup"] = timings
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    regressions = compare({"startup": timings}, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"Regression in {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import bisect
+import numpy as np
+import pandas as pd
+
+# Settings of the synthetic users
+TIMEZONES = ["America/Mexico_City", "Europe/Madrid", "Asia/Tokyo", "Australia/Sydney", "UTC"]
+COLORS = ["berry_red", "red", "orange", "yellow", "olive_green", "lime_green", "green", "mint_green", "teal",
+          "sky_blue", "light_blue", "blue", "grape", "violet", "lavender", "magenta", "salmon", "charcoal", "grey"]
+LABELS = ["home", "work", "errand", "deep_work", "call", "email", "reading", "health", "finance", "family"]
+WORDS = ["review", "write", "call", "plan", "buy", "fix", "read", "prepare", "send", "update", "clean", "book",
+         "report", "draft", "meeting", "invoice", "groceries", "workout", "notes", "budget", "design", "tests"]
+
+
+class Workload:
+    # Sync and completed/get_all payloads of a synthetic user with the given number of tasks
+    def __init__(self, tasks, years=3, projects=30, active_share=0.05, habits=40, timezone=None, seed=0):
+        rng = np.random.default_rng(seed)
+        self.now = pd.Timestamp.now(tz="UTC").floor("s")
+        joined_at = self.now - pd.Timedelta(days=365 * years)
+        timezone = timezone or TIMEZONES[seed % len(TIMEZONES)]
+
+        # Projects
+        self.projects = [{"id": str(2200000000 + i), "name": f"Project {i}" if i else "Inbox",
+                          "color": COLORS[i % len(COLORS)]} for i in range(projects)]
+        project_ids = np.array([project["id"] for project in self.projects])
+
+        # Active tasks, a few of them recurring habits that are completed again and again
+        active = max(int(tasks * active_share), habits, 1)
+        habits = min(habits, active)
+        ids = 6000000000 + np.arange(active)
+        due_days = rng.integers(-30, 60, active)
+        recurring = np.arange(active) < habits
+        self.items = [{"id": str(ids[i]),
+                       "content": self._content(rng),
+                       "priority": int(rng.integers(1, 5)),
+                       "project_id": project_ids[rng.integers(0, projects)],
+                       "labels": list(rng.choice(LABELS, rng.integers(0, 4), replace=False)),
+                       "added_at": self._format(joined_at + (self.now - joined_at) * rng.random()),
+                       "due": {"date": (self.now + pd.Timedelta(days=int(due_days[i]))).strftime("%Y-%m-%d"),
+                               "is_recurring": bool(recurring[i])} if recurring[i] or rng.random() < 0.4 else None,
+                       "checked": False, "is_deleted": False}
+                      for i in range(active)]
+
+        # Completed history: habits completed every few days and one off tasks spread over the years
+        completed = tasks - active
+        from_habits = min(completed // 2, habits * 365 * years // 2)
+        habit_ids = rng.integers(0, habits, from_habits)
+        one_off_ids = 7000000000 + np.arange(completed - from_habits)
+        task_ids = np.concatenate([ids[habit_ids], one_off_ids])
+        seconds = (self.now - joined_at).total_seconds()
+        completed_at = joined_at + pd.to_timedelta(np.sort(rng.random(task_ids.shape[0]) * seconds)[::-1], unit="s")
+        projects_of = rng.integers(0, projects, task_ids.shape[0])
+        phrases = [self._content(rng) for _ in range(1000)]
+        contents = [self.items[i]["content"] for i in habit_ids] + \
+            [phrases[i] for i in rng.integers(0, len(phrases), one_off_ids.shape[0])]
+        self.completed = [{"id": str(8000000000 + i),
+                           "task_id": str(task_id),
+                           "content": content,
+                           "project_id": project_ids[project],
+                           "completed_at": date,
+                           "note_count": 0,
+                           "meta_data": None}
+                          for i, (task_id, content, project, date) in enumerate(zip(task_ids, contents, projects_of,
+                                                                                    self._format(completed_at)))]
+        self.completed.sort(key=lambda item: item["completed_at"], reverse=True)
+
+        # Completion times in ascending order to find the pages of a time window with a binary search
+        self._times = [item["completed_at"] for item in reversed(self.completed)]
+
+        self.user = {"id": 40000000 + seed, "full_name": f"Benchmark user {seed}", "email": f"user{seed}@example.com",
+                     "tz_info": {"timezone": timezone}, "start_day": 1 + seed % 7, "days_off": [6, 7],
+                     "daily_goal": 5, "weekly_goal": 25, "joined_at": self._format(joined_at),
+                     "completed_count": len(self.completed)}
+
+    @staticmethod
+    def _content(rng):
+        return " ".join(rng.choice(WORDS, rng.integers(2, 7))).capitalize()
+
+    @staticmethod
+    def _format(timestamp):
+        return timestamp.strftime("%Y-%m-%dT%H:%M:%S.000000Z")
+
+    def sync(self):
+        # Response of a full sync
+        return {"sync_token": "benchmark", "full_sync": True, "user": self.user, "projects": self.projects,
+                "items": self.items}
+
+    def completed_page(self, limit=200, offset=0, since=None, until=None):
+        # Response of completed/get_all, newest first, within the optional time window
+        since = f"{since}.000000Z" if since else None
+        until = f"{until}.999999Z" if until else None
+        last = len(self._times) - (bisect.bisect_left(self._times, since) if since else 0)
+        first = len(self._times) - bisect.bisect_right(self._times, until) if until else 0
+        items = self.completed[first + offset:min(first + offset + limit, last)]
+        projects = {item["project_id"] for item in items}
+        return {"items": items, "projects": {project["id"]: project for project in self.projects
+                                             if project["id"] in projects}}
\ No newline at end of file
@@ -1,7 +1,6 @@
 import streamlit as st
-from datetime import date, timedelta
-from src.utils import is_data_ready
-from src.plots import plot_with_average
+from src.utils import page_run, is_data_ready, get_cube
+from src.plots import plot_image, plot_with_average
 
 
 def habits_and_goals_metrics(goal, actual, habits):
@@ -22,8 +21,12 @@ def render():
     #             DATA             #
     ################################
 
-    # Get all tasks
-    tasks = st.session_state["tasks"].copy().dropna(subset=["completed_at"])
+    # Get the aggregated completed tasks
+    cube = get_cube()
+    counts_per_day = cube.daily("completed")
+    if counts_per_day.empty:
+        st.info("Your completed tasks are still loading.")
+        return
 
     ################################
     #           SIDEBAR            #
@@ -37,48 +40,18 @@ def render():
                                          value=30,
                                          format="%i%%") / 100.0
     selected_date = st.sidebar.date_input("Date",
-                                          max(tasks["completed_at"].to_list()),
-                                          min_value=min(tasks["completed_at"].to_list()),
-                                          max_value=max(tasks["completed_at"].to_list()))
-
-    # Unpack date
-    year = selected_date.year
-    month = selected_date.month
-    quarter = (month - 1) // 3 + 1
-    day = selected_date.day
-    start_day = 8 - st.session_state["user"]["start_day"]
-    week = (date(year, month, day) + timedelta(days=start_day)).isocalendar()[1]
+                                          counts_per_day.index.max(),
+                                          min_value=counts_per_day.index.min(),
+                                          max_value=counts_per_day.index.max())
 
     ################################
     #         FILTER DATA          #
     ################################
 
-    # Tasks per period of time
-    tasks_of_year = tasks[tasks["completed_year"] == year]
-    tasks_of_quarter = tasks_of_year[tasks_of_year["completed_quarter"] == quarter]
-    tasks_of_month = tasks_of_quarter[tasks_of_quarter["completed_month"] == month]
-    tasks_of_week = tasks_of_year[tasks_of_year["completed_week"] == week]
-
-    # Filter for habits
-    habits = tasks[tasks.duplicated(subset=["task_id"], keep=False)]
-    habits_of_year = habits[habits["completed_year"] == year]
-    habits_of_quarter = habits_of_year[habits_of_year["completed_quarter"] == quarter]
-    habits_of_month = habits_of_quarter[habits_of_quarter["completed_month"] == month]
-    habits_of_week = habits_of_year[habits_of_year["completed_week"] == week]
-
-    # Get the number of aggregated tasks per day
-    counts_of_year_per_day = tasks_of_year["task_id"].groupby(by=tasks_of_year['completed_at'].dt.date).count()
-    counts_of_quarter_per_day = counts_of_year_per_day[tasks_of_quarter['completed_at'].dt.date]
-    counts_of_month_per_day = counts_of_quarter_per_day[tasks_of_month['completed_at'].dt.date]
-    counts_of_week_per_day = counts_of_year_per_day[tasks_of_week['completed_at'].dt.date]
-
-    # Get the number of aggregated tasks per month
-    month_names = ['January', 'February', 'March', 'April', 'May', 'June',
-                   'July', 'August', 'September', 'October', 'November', 'December']
-    counts_of_year_per_month = tasks_of_year["task_id"].groupby(by=tasks_of_year['completed_month']).count()
-    counts_of_quarter_per_month = counts_of_year_per_month[tasks_of_quarter['completed_month']]
-    counts_of_year_per_month.set_axis([month_names[i - 1] for i in counts_of_year_per_month.index], inplace=True)
-    counts_of_quarter_per_month.set_axis([month_names[i - 1] for i in counts_of_quarter_per_month.index], inplace=True)
+    # Periods of time containing the selected date as filters of the aggregated tasks
+    of_week = {"period": "week", "anchor_date": selected_date}
+    of_month = {"period": "month", "anchor_date": selected_date}
+    of_quarter = {"period": "quarter", "anchor_date": selected_date}
 
     ################################
     #        MAIN DASHBOARD        #
@@ -89,34 +62,56 @@ def render():
 
     # Week category pie and plot with average
     st.header("Week")
-    habits_and_goals_metrics(habit_percentage, tasks_of_week.shape[0], habits_of_week.shape[0])
-    fig1, _ = plot_with_average(counts_of_week_per_day,
-                                x_label="Day",
-                                y_label="# Tasks",
-                                labelrotation=30,
-                                x_tick_interval=1)
-    st.pyplot(fig1)
+    habits_and_goals_metrics(habit_percentage, cube.count(**of_week), cube.count(habit=True, **of_week))
+    image = plot_image(plot_with_average, cube.daily(**of_week),
+                       x_label="Day",
+                       y_label="# Tasks",
+                       labelrotation=30,
+                       x_tick_interval=1)
+    st.image(image, use_column_width=True)
 
     # Month category pie and plot with average
     st.header("Month")
-    habits_and_goals_metrics(habit_percentage, tasks_of_month.shape[0], habits_of_month.shape[0])
-    fig2, _ = plot_with_average(counts_of_month_per_day,
-                                x_label="Day",
-                                y_label="# Tasks",
-                                labelrotation=30,
-                                x_tick_interval=2)
-    st.pyplot(fig2)
+    habits_and_goals_metrics(habit_percentage, cube.count(**of_month), cube.count(habit=True, **of_month))
+    image = plot_image(plot_with_average, cube.daily(**of_month),
+                       x_label="Day",
+                       y_label="# Tasks",
+                       labelrotation=30,
+                       x_tick_interval=2)
+    st.image(image, use_column_width=True)
 
     # Quarter category pie and plot with average
     st.header("Quarter")
-    habits_and_goals_metrics(habit_percentage, tasks_of_quarter.shape[0], habits_of_quarter.shape[0])
-    fig3, _ = plot_with_average(counts_of_quarter_per_day,
-                                x_label="Day",
-                                y_label="# Tasks",
-                                labelrotation=30)
-    st.pyplot(fig3)
+    habits_and_goals_metrics(habit_percentage, cube.count(**of_quarter), cube.count(habit=True, **of_quarter))
+    image = plot_image(plot_with_average, cube.daily(**of_quarter),
+                       x_label="Day",
+                       y_label="# Tasks",
+                       labelrotation=30)
+    st.image(image, use_column_width=True)
+
+    # Streaks and consistency of the habits
+    st.header("Streaks")
+    habits = cube.habits.habits()
+    if habits.empty:
+        st.info("You don't have habits yet, complete a recurring task at least twice to start one.")
+        return
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Active streaks", int((habits["current_streak"] > 0).sum()),
+                help="Habits completed this week or the last one.")
+    col2.metric("Longest streak", "{} weeks".format(int(habits["longest_streak"].max())),
+                help="Most consecutive weeks completing the same habit.")
+    col3.metric("Consistency", "{:.0%}".format(habits["consistency"].mean()),
+                help="Average share of weeks with the habit completed since it was first completed.")
+    table_str = "| Habit | Completed | Current streak | Longest streak | Consistency |\n"
+    table_str += "|----|----|----|----|----|\n"
+    top = habits.sort_values(["current_streak", "longest_streak", "count"], ascending=False).head(10)
+    for task, count, current, longest, consistency in zip(top["content"], top["count"], top["current_streak"],
+                                                          top["longest_streak"], top["consistency"]):
+        table_str += f"| {task} | {count} | {current} weeks | {longest} weeks | {consistency:.0%} |\n"
+    st.markdown(table_str)
 
 
 if __name__ == "__main__":
-    if is_data_ready():
-        render()
+    with page_run("Habits"):
+        if is_data_ready():
+            render()
@@ -1,10 +1,21 @@
-import pandas as pd
 from datetime import date
 import streamlit as st
-from src.utils import is_data_ready
-from src.plots import plot_with_average, histogram
-from prophet import Prophet
-from prophet.plot import add_changepoints_to_plot
+from src.utils import page_run, is_data_ready
+from src.plots import plot_image, plot_with_average, histogram, forecast_plot
+from src import forecast
+
+
+def recommended_goals(result, daily_placeholder, weekly_placeholder, pending=False):
+    days_off = st.session_state["user"]["days_off"]
+    recommended_daily_goal, recommended_weekly_goal = forecast.recommended_goals(result["forecast"], days_off)
+    method = "ML forecast" if result["method"] == "prophet" else "seasonal moving average forecast"
+    note = " while the ML forecast is calculated" if pending else ""
+    daily_placeholder.metric("Recommended Goal",
+                             "{} tasks".format(round(recommended_daily_goal)),
+                             help=f"Calculated using {method} over the next week (excludes days off){note}")
+    weekly_placeholder.metric("Recommended Goal",
+                              "{} tasks".format(round(recommended_weekly_goal)),
+                              help=f"Calculated using {method} over the next week{note}")
 
 
 def render():
@@ -13,45 +24,31 @@ def render():
     st.sidebar.caption("Change your day and week goals in the [productivity settings]("
                        "https://todoist.com/app/settings/productivity) inside of todoist.")
 
-    # Get all tasks
-    completed_tasks = st.session_state["tasks"].copy().dropna(subset=["completed_at"])
-    completed_tasks["week"] = completed_tasks["completed_year"].astype(str) + "-S" + \
-        completed_tasks["completed_week"].map(lambda x: "{:02d}".format(x))
-
-    # Get count of completed tasks per day and week
-    completed_tasks_per_day = completed_tasks["task_id"].groupby(by=completed_tasks["completed_at"].dt.date)\
-                                                        .count().rename("count")
-    completed_tasks_per_week = completed_tasks["task_id"].groupby(by=completed_tasks["week"]).count().rename("count")
-
-    # Calculate Velocity
-    day_velocity = completed_tasks_per_day.ewm(span=7).mean()[-2]
-    week_velocity = completed_tasks_per_week.ewm(span=13).mean()[-2]
-
-    # Create forecast over the next week of the data
-    data = completed_tasks_per_day.copy().reset_index()
-    data = data.rename(columns={"completed_at": "ds", "count": "y"})
-    m = Prophet(changepoint_prior_scale=2.0)
-    m.fit(data)
-    future = m.make_future_dataframe(periods=7)
-    forecast = m.predict(future)
-
-    # Calculate recommended goals based on predictions
-    prediction = forecast[["ds", "trend", "yhat"]].tail(7)
-    prediction["yhat"][prediction["yhat"] <= 0.0] = prediction["trend"]
-    prediction["day_of_the_week"] = prediction["ds"].apply(lambda x: x.weekday() + 1)
-    recommended_daily_goal = prediction[prediction["day_of_the_week"].apply(
-                                lambda x: x not in st.session_state["user"]["days_off"])]["yhat"].mean()
-    recommended_weekly_goal = prediction["yhat"].sum()
+    # Get count of completed tasks per day and week, kept up to date as the tasks are collected
+    tasks = st.session_state["tasks"]
+    completed_tasks_per_day = tasks.counts.per_day().rename("count")
+    completed_tasks_per_week = tasks.counts.per_week().rename("count")
+    completed_tasks_per_week.index = ["{}-S{:02d}".format(year, week) for year, week in completed_tasks_per_week.index]
+    if completed_tasks_per_day.shape[0] < 2 or completed_tasks_per_week.shape[0] < 2:
+        st.info("Your completed tasks are still loading.")
+        return
+
+    # Velocity (kept with the counts)
+    day_velocity = tasks.counts.day_velocity()
+    week_velocity = tasks.counts.week_velocity()
+
+    # Start the forecast over the next week of the data (cached and fitted in another process)
+    forecast_future = forecast.submit(completed_tasks_per_day, periods=7, changepoint_prior_scale=2.0)
 
     # Get goals per day and week
     daily_goal = st.session_state["user"].get("daily_goal", 0)
     weekly_goal = st.session_state["user"].get("weekly_goal", 0)
 
     # Get age of active tasks
-    active_tasks = st.session_state["tasks"].copy()
-    active_tasks = active_tasks[active_tasks["added_at"].apply(lambda x: not pd.isnull(x))]
-    active_tasks = active_tasks[active_tasks["due_date"].apply(lambda x: pd.isnull(x))]
-    active_tasks = active_tasks[active_tasks["recurring"].apply(lambda x: not x)]
+    work_in_progress, average_age = tasks.work_in_progress()
+    active_tasks = tasks.select(["added_at", "project_name", "labels", "content", "task_id"],
+                                rows=tasks.column("added_at").notna() & tasks.column("due_date").isna() &
+                                ~tasks.column("recurring"))
     active_tasks["age_in_days"] = (date.today() - active_tasks["added_at"].dt.date).dt.days
 
     # Daily goals, velocity and recommendation
@@ -62,21 +59,18 @@ def render():
     col2.metric("Actual Velocity (tasks/day)",
                 "{}".format(round(day_velocity, 1)),
                 help="Calculated using Exponential Moving Average on 7 days (EMA7) for yesterday.")
-    col3.metric("Recommended Goal",
-                "{} tasks".format(round(recommended_daily_goal)),
-                help="Calculated using ML forecast over the next week (excludes days off)")
-    day_fig, _ = plot_with_average(completed_tasks_per_day,
-                                   x_label="Date",
-                                   y_label="# Tasks",
-                                   labelrotation=30,
-                                   x_tick_interval=30)
-    st.pyplot(day_fig)
+    daily_goal_placeholder = col3.empty()
+    image = plot_image(plot_with_average, completed_tasks_per_day,
+                       x_label="Date",
+                       y_label="# Tasks",
+                       labelrotation=30,
+                       x_tick_interval=30)
+    st.image(image, use_column_width=True)
 
     # Plot forecast
     with st.expander("Trend Line Analysis"):
-        forecast_fig = m.plot(forecast)
-        add_changepoints_to_plot(forecast_fig.gca(), m, forecast)
-        st.pyplot(forecast_fig)
+        forecast_placeholder = st.empty()
+        forecast_placeholder.caption("⌛ Calculating the forecast of the next week")
 
     # Weekly goals, velocity and recommendation
     col1, col2, col3 = st.columns(3)
@@ -86,29 +80,29 @@ def render():
     col2.metric("Actual Velocity (tasks/week)",
                 "{}".format(round(week_velocity, 1)),
                 help="Calculated using Exponential Moving Average on 13 weeks (EMA13) for last week.")
-    col3.metric("Recommended Goal",
-                "{} tasks".format(round(recommended_weekly_goal)),
-                help="Calculated using ML forecast over the next week")
-    week_fig, _ = plot_with_average(completed_tasks_per_week,
-                                    x_label="Week",
-                                    y_label="# Tasks",
-                                    labelrotation=30,
-                                    x_tick_interval=5)
-    st.pyplot(week_fig)
+    weekly_goal_placeholder = col3.empty()
+    if not forecast_future.done():
+        recommended_goals(forecast.fast_forecast(completed_tasks_per_day, periods=7),
+                          daily_goal_placeholder, weekly_goal_placeholder, pending=True)
+    image = plot_image(plot_with_average, completed_tasks_per_week,
+                       x_label="Week",
+                       y_label="# Tasks",
+                       labelrotation=30,
+                       x_tick_interval=5)
+    st.image(image, use_column_width=True)
 
     # WIP, age, and lead time
     col1, col2, col3 = st.columns(3)
     col1.metric("Work In Progress",
-                "{} tasks".format(active_tasks.shape[0]),
+                "{} tasks".format(work_in_progress),
                 help="Current amount of active tasks.")
     col2.metric("Average Age",
-                "{} days".format(round(active_tasks["age_in_days"].mean(), 1)),
+                "{} days".format(round(average_age, 1)),
                 help="Average age since tasks were created.")
     col3.metric("Lead time",
-                "{} days".format(round(active_tasks.shape[0] / day_velocity, 1)),
+                "{} days".format(round(work_in_progress / day_velocity, 1)),
                 help="Expected amount of time to complete a task once its created.")
-    fig, _ = histogram(active_tasks["age_in_days"])
-    st.pyplot(fig)
+    st.image(plot_image(histogram, active_tasks["age_in_days"]), use_column_width=True)
 
     # Oldest task list
     with st.expander("Oldest tasks"):
@@ -118,12 +112,20 @@ def render():
         table_str += "|----|----|----|----|----|\n"
         for added, project, labels, task, task_id in zip(oldest["added_at"], oldest["project_name"], oldest["labels"],
                                                          oldest["content"], oldest["task_id"]):
-            table_str += f"| **{added.date()}** | {project} | {', '.join(labels)} | {task} | " \
+            table_str += f"| **{added.date()}** | {project} | {labels} | {task} | " \
                          f"*[open in todoist](https://todoist.com/app/task/{task_id})* | \n"
         st.markdown(table_str)
         st.write("")
 
+    # Fill in the recommended goals and trend once the forecast is ready, waiting a short time at most (the fast
+    # forecast is shown until a later run finds the fit ready)
+    result = forecast.result(forecast_future, completed_tasks_per_day, periods=7)
+    recommended_goals(result, daily_goal_placeholder, weekly_goal_placeholder, pending=result.get("pending", False))
+    image = plot_image(forecast_plot, completed_tasks_per_day, result["forecast"], result["changepoints"])
+    forecast_placeholder.image(image, use_column_width=True)
+
 
 if __name__ == "__main__":
-    if is_data_ready():
-        render()
+    with page_run("Productivity"):
+        if is_data_ready():
+            render()
@@ -1,13 +1,13 @@
 from datetime import date, timedelta
 import pandas as pd
 import streamlit as st
-from src.utils import is_data_ready
+from src.utils import page_run, is_data_ready
 
 
 def expandable_with_tasks(task_list, day, expanded=False):
     today = date.today()
     day_goal = st.session_state["user"].get("daily_goal", 0)
-    completed_list = task_list["due_date"].apply(lambda x: x is pd.NaT).tolist()
+    completed_list = task_list["due_date"].isna().tolist()
 
     if day < today:
         emoji = "🏆" if task_list.shape[0] > day_goal else "❌"
@@ -28,6 +28,15 @@ def expandable_with_tasks(task_list, day, expanded=False):
                 st.markdown("⌛ " + task + f" **→** *[open in todoist](https://todoist.com/app/task/{task_id})*")
 
 
+def rank_tasks(task_list, sort_project):
+    # Sort keys: higher priority first, then newer tasks of better ranked projects, then older tasks
+    age = (pd.Timestamp(date.today()) - task_list["added_at"].dt.tz_localize(None).dt.normalize()).dt.days
+    task_list["priority_key"] = -task_list["priority"].cat.codes
+    task_list["rank"] = ((age.max() - age) / age.max()).fillna(0) + \
+        task_list["project_name"].map(sort_project).astype("float") / len(sort_project)
+    return task_list
+
+
 def render():
     # Header
     st.title("Planing")
@@ -39,27 +48,20 @@ def render():
     col5.metric("Extra tasks", "➖")
     col6.metric("Suggestions", "💡")
 
-    # Combine due date and completed date
-    week_tasks = st.session_state["tasks"].copy()
-    week_tasks["date"] = week_tasks.apply(lambda x: x["due_date"] if x["completed_at"] is pd.NaT else x["completed_at"],
-                                          axis=1)
-    week_tasks["week"] = week_tasks.apply(lambda x: x["due_week"] if x["completed_at"] is pd.NaT else
-                                          x["completed_week"], axis=1)
-    week_tasks["year"] = week_tasks.apply(lambda x: x["due_year"] if x["completed_at"] is pd.NaT else
-                                          x["completed_year"], axis=1)
-
-    # Filter tasks of the week
-    week_tasks = week_tasks[week_tasks["year"] == date.today().year]
-    week_tasks = week_tasks[week_tasks["week"] == date.today().isocalendar()[1]]
-    week_tasks = week_tasks.sort_values(by=["completed_at", "due_date"])
+    # Combine due date and completed date, then keep only the tasks of the week
+    tasks = st.session_state["tasks"]
+    columns = ["task_id", "content", "project_name", "priority", "added_at", "completed_at", "due_date"]
+    completed_in_week = tasks.slice("week", date.today(), "completed_at", columns)
+    due_in_week = tasks.slice("week", date.today(), "due_date", columns)
+    week_tasks = pd.concat([completed_in_week, due_in_week[due_in_week["completed_at"].isna()]])
+    week_tasks["date"] = week_tasks["completed_at"].where(week_tasks["completed_at"].notna(), week_tasks["due_date"])
 
     # Layout of page
     other_col, now_col, suggestions_col = st.columns([1, 2, 1])
 
     # Suggestions
-    suggestions = st.session_state["tasks"].copy()
-    suggestions = suggestions[suggestions["completed_at"].isnull()]
-    suggestions = suggestions[suggestions["due_date"].isnull()]
+    suggestions = tasks.select(["task_id", "content", "project_name", "priority", "added_at"],
+                               rows=tasks.column("completed_at").isna() & tasks.column("due_date").isna())
 
     # Sidebar rank projects
     st.sidebar.subheader("Rank each project to get suggestions")
@@ -70,25 +72,16 @@ def render():
         sort_project[project] = i
         projects.remove(project)
 
-    # Rank suggestions by priority, rank and age
-    suggestions["age"] = (date.today() - suggestions["added_at"].dt.date).dt.days
-    suggestions["rank"] = (suggestions["age"].max() - suggestions["age"])/suggestions["age"].max() + \
-        suggestions["project_name"].map(sort_project)/len(sort_project)
-    suggestions = suggestions.sort_values(by=["priority", "rank", "added_at"], ascending=[False, True, True])
-
-    # Rank week tasks by priority, rank and age
-    week_tasks["age"] = (date.today() - week_tasks["added_at"].dt.date).dt.days
-    week_tasks["rank"] = (week_tasks["age"].max() - week_tasks["age"]) / week_tasks["age"].max() + \
-        week_tasks["project_name"].map(sort_project) / len(sort_project)
+    # Rank suggestions and week tasks by priority, rank and age
+    suggestions = rank_tasks(suggestions, sort_project)
+    week_tasks = rank_tasks(week_tasks, sort_project)
     week_tasks = week_tasks.sort_values(by=["completed_at",
-                                            "priority",
+                                            "priority_key",
                                             "rank",
-                                            "added_at"], ascending=[True, False, True, True])
-
-    # Group by day in expanders
-    for day in week_tasks["date"].apply(lambda x: x.date).unique():
-        tasks_in_the_day = week_tasks[week_tasks["date"].apply(lambda x: x.strftime('%A')) == day.strftime('%A')]
+                                            "added_at"], ascending=[True, True, True, True])
 
+    # Group by day in expanders, in the order of their first task
+    for day, tasks_in_the_day in week_tasks.groupby(week_tasks["date"].dt.date, sort=False):
         if date.today() == day:
             with now_col:
                 expandable_with_tasks(tasks_in_the_day, day, expanded=True)
@@ -106,7 +99,11 @@ def render():
             tasks_left = 0
             suggestion_list.write("🏆 Great you have planned your week!")
 
-        suggestions = suggestions.head(tasks_left + 10)
+        # Only the best suggestions are needed, so they are selected without sorting the whole backlog (tasks without
+        # a ranked project go last, as nsmallest would drop them)
+        best = suggestions[["priority_key", "rank", "added_at"]].fillna({"rank": float("inf")})
+        best = best.nsmallest(tasks_left + 10, ["priority_key", "rank", "added_at"])
+        suggestions = suggestions.loc[best.index]
 
         for i, (task_id, content) in enumerate(zip(suggestions["task_id"], suggestions["content"])):
             if i < tasks_left:
@@ -118,5 +115,6 @@ def render():
 
 
 if __name__ == "__main__":
-    if is_data_ready():
-        render()
+    with page_run("Planning"):
+        if is_data_ready():
+            render()
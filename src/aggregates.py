@@ -0,0 +1,115 @@
+import itertools
+import numpy as np
+import pandas as pd
+from src.habits import HabitIndex
+from src.store import period_bounds
+
+# Dimensions of the daily cubes and of the category counts
+CUBE_COLUMNS = ["date", "year", "quarter", "month", "week", "project_name", "priority", "habit"]
+CATEGORY_COLUMNS = ["project_name", "priority", "completed", "active", "due"]
+
+# Columns read from the history spilled to disk
+SOURCE_COLUMNS = ["task_id", "project_name", "priority", "completed_at", "due_date",
+                  "completed_year", "completed_quarter", "completed_month", "completed_week",
+                  "due_year", "due_quarter", "due_month", "due_week"]
+
+
+class TaskCube:
+    def __init__(self, tasks, history=None, start_day=1, habits=None):
+        self.start_day = start_day
+
+        # Older completed tasks spilled to disk are read one part at a time after the tasks in memory
+        def frames():
+            return itertools.chain([tasks], history(columns=SOURCE_COLUMNS) if history is not None else [])
+
+        # Habits come from the index kept while collecting, or are indexed here when it is not given
+        if habits is None:
+            habits = HabitIndex(start_day)
+            for frame in frames():
+                habits.add(frame)
+        self.habits = habits
+        habit_ids = habits.ids
+
+        # Count completed and due tasks per day, project, priority and habit, and all tasks per category
+        completed, due, categories = [], [], []
+        for frame in frames():
+            habit = frame["task_id"].isin(habit_ids)
+            completed.append(self._daily_counts(frame, "completed_at", "completed", habit))
+            due.append(self._daily_counts(frame[frame["priority"] != "Priority 0"], "due_date", "due", habit))
+            categories.append(self._category_counts(frame))
+        # Daily counts are sorted by date so periods are sliced with a binary search
+        self.completed = self._combine(completed, CUBE_COLUMNS).sort_values("date", ignore_index=True)
+        self.due = self._combine(due, CUBE_COLUMNS).sort_values("date", ignore_index=True)
+        self.categories = self._combine(categories, CATEGORY_COLUMNS)
+
+    @staticmethod
+    def _combine(counts, columns):
+        # Sum the counts of each part of the tasks
+        if len(counts) == 1:
+            return counts[0]
+        return pd.concat(counts, ignore_index=True)\
+            .groupby(columns, observed=True, dropna=False)["count"].sum().reset_index()
+
+    @staticmethod
+    def _category_counts(tasks):
+        return pd.DataFrame({"project_name": tasks["project_name"],
+                             "priority": tasks["priority"],
+                             "completed": tasks["completed_at"].notna(),
+                             "active": tasks["priority"] != "Priority 0",
+                             "due": tasks["due_date"].notna()})\
+            .groupby(CATEGORY_COLUMNS, observed=True, dropna=False).size().rename("count").reset_index()
+
+    @staticmethod
+    def _daily_counts(tasks, column, prefix, habit):
+        tasks = tasks[tasks[column].notna()]
+        keys = pd.DataFrame({"date": tasks[column].dt.tz_localize(None).dt.normalize(),
+                             "year": tasks[f"{prefix}_year"],
+                             "quarter": tasks[f"{prefix}_quarter"],
+                             "month": tasks[f"{prefix}_month"],
+                             "week": tasks[f"{prefix}_week"],
+                             "project_name": tasks["project_name"],
+                             "priority": tasks["priority"],
+                             "habit": habit.loc[tasks.index]})
+        return keys.groupby(CUBE_COLUMNS, observed=True, dropna=False).size().rename("count").reset_index()
+
+    def _slice(self, kind, habit=None, period=None, anchor_date=None, **filters):
+        # Rows of the cube in the period containing the anchor date matching the habit flag and the other filters
+        cube = self.completed if kind == "completed" else self.due
+        if period is not None:
+            start, end = period_bounds(period, anchor_date, self.start_day)
+            first, last = np.searchsorted(cube["date"].values,
+                                          [np.datetime64(start, "ns"), np.datetime64(end, "ns")])
+            cube = cube.iloc[first:last]
+        mask = pd.Series(True, index=cube.index)
+        if habit is not None:
+            mask &= cube["habit"] == habit
+        for column, value in filters.items():
+            mask &= cube[column] == value
+        return cube[mask]
+
+    def count(self, kind="completed", habit=None, period=None, anchor_date=None, **filters):
+        return int(self._slice(kind, habit, period, anchor_date, **filters)["count"].sum())
+
+    def daily(self, kind="completed", habit=None, period=None, anchor_date=None, **filters):
+        # Count of tasks per day (only days with tasks) indexed by date
+        counts = self._slice(kind, habit, period, anchor_date, **filters).groupby("date")["count"].sum()
+        counts.index = counts.index.date
+        return counts
+
+    def weekly(self, kind="completed", habit=None, period=None, anchor_date=None, **filters):
+        # Count of tasks per week indexed by the year and week
+        return self._slice(kind, habit, period, anchor_date, **filters).groupby(["year", "week"])["count"].sum()
+
+    def totals(self, **filters):
+        # Count of tasks matching the state filters (completed, active, due)
+        categories = self.categories
+        for column, value in filters.items():
+            categories = categories[categories[column] == value]
+        return int(categories["count"].sum())
+
+    def category_counts(self, category, **filters):
+        # Count of tasks per category sorted from the most common
+        categories = self.categories
+        for column, value in filters.items():
+            categories = categories[categories[column] == value]
+        return categories.groupby(category, observed=True)["count"].sum().sort_values(ascending=False)
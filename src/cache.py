@@ -0,0 +1,182 @@
+import os
+import glob
+import itertools
+import hashlib
+import shutil
+import contextlib
+import tempfile
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Location and size cap of the completed history cache
+cache_dir = os.environ.get("CACHE_DIR", os.path.join(tempfile.gettempdir(), "task-analytics"))
+cache_max_bytes = int(os.environ.get("CACHE_MAX_MB", 512)) * 1024 * 1024
+spill_dir = os.path.join(cache_dir, "spill")
+
+# Tasks of each session published as Arrow files that every worker process memory-maps (0 disables it)
+shared_snapshots = os.environ.get("SHARED_SNAPSHOTS", "1").lower() not in ("0", "false", "no")
+snapshot_dir = os.path.join(cache_dir, "snapshots")
+
+# Version of the layout of the items, files of older layouts are not read
+cache_format = 2
+
+
+def _user_key(user):
+    # The files depend on the settings used to derive the calendar columns
+    settings = f"{cache_format}-{user['tz_info']['timezone']}-{user['start_day']}"
+    return f"{user['id']}-{hashlib.md5(settings.encode()).hexdigest()[:8]}"
+
+
+def start_day_of(path, timezone):
+    # Start day of the week used to write a cached history file, found from its name, None if it does not match any
+    name = os.path.basename(path)
+    for start_day in range(1, 8):
+        user = {"id": name.split("-")[0], "tz_info": {"timezone": timezone}, "start_day": start_day}
+        if name == f"{_user_key(user)}.parquet":
+            return start_day
+    return None
+
+
+def _cache_path(user):
+    return os.path.join(cache_dir, f"{_user_key(user)}.parquet")
+
+
+def load_history(user):
+    # Read the cached history of the user if available, or the newer snapshot published by another process
+    path = _cache_path(user)
+    snapshot = latest_snapshot(user)
+    if snapshot is not None and (not os.path.exists(path) or os.path.getmtime(snapshot) > os.path.getmtime(path)):
+        try:
+            table = open_snapshot(snapshot)
+            if table.schema.metadata.get(b"history") == b"complete":
+                items = table.to_pandas()
+                return items[items["completed_at"].notna()].reset_index(drop=True)
+        except Exception as e:
+            print(f"Snapshot {snapshot} could not be read: {e}")
+    if not os.path.exists(path):
+        return None
+    try:
+        items = pd.read_parquet(path)
+    except Exception as e:
+        print(f"Cache file {path} could not be read: {e}")
+        os.remove(path)
+        return None
+
+    # Mark the file as recently used
+    os.utime(path)
+    return items
+
+
+def save_history(user, items, spilled=()):
+    # Write to a temporary file first so readers never see a partial file
+    _make_dir(cache_dir)
+    path = _cache_path(user)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+
+    # Parts spilled to disk are written one at a time, with one dictionary type as their categories differ
+    writer = None
+    try:
+        for frame in itertools.chain(spilled, [items]):
+            table = pa.Table.from_pandas(frame.reset_index(drop=True), preserve_index=False)
+            if writer is None:
+                schema = pa.schema([field.with_type(pa.dictionary(pa.int32(), pa.string()))
+                                    if pa.types.is_dictionary(field.type) else field for field in table.schema],
+                                   metadata=table.schema.metadata)
+                writer = pq.ParquetWriter(tmp_path, schema)
+            writer.write_table(table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, path)
+    _evict()
+
+
+def invalidate(user_id=None):
+    # Remove the cache and the snapshots of one user or all users
+    pattern = f"{user_id}-*" if user_id is not None else "*"
+    for path in glob.glob(os.path.join(cache_dir, f"{pattern}.parquet")):
+        os.remove(path)
+    for path in glob.glob(os.path.join(snapshot_dir, pattern)):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def save_snapshot(user, key, version, items, complete=False):
+    # Write one version of the tasks of a session to a temporary file first so readers never see a partial file,
+    # complete snapshots have every completed task (the history was fully collected and none was spilled) and can be
+    # used as the history of the user
+    folder = os.path.join(snapshot_dir, _user_key(user))
+    _make_dir(folder)
+    path = os.path.join(folder, f"{key}-{version:08d}.arrow")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    table = pa.Table.from_pandas(items.reset_index(drop=True), preserve_index=False)
+    table = table.replace_schema_metadata(dict(table.schema.metadata or {},
+                                               history=b"complete" if complete else b"partial"))
+    try:
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    # Older versions of the session are removed (snapshots of other sessions are left to them and to the size cap),
+    # the processes that mapped them keep reading them until released
+    for old in glob.glob(os.path.join(folder, f"{key}-*.arrow")):
+        if old != path:
+            with contextlib.suppress(OSError):
+                os.remove(old)
+    _evict()
+    return path
+
+
+def latest_snapshot(user):
+    # Path of the newest snapshot of the user published by any process, if any
+    paths = glob.glob(os.path.join(snapshot_dir, _user_key(user), "*.arrow"))
+    return max(paths, key=os.path.getmtime, default=None)
+
+
+def open_snapshot(path):
+    # Tasks of a snapshot memory-mapped without copying, the pages of the file are shared by every process reading it
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def spill(key, part, items):
+    # Write a part of the items of a session that does not fit in its memory budget
+    _make_dir(os.path.join(spill_dir, key))
+    items.reset_index(drop=True).to_parquet(_spill_path(key, part), index=False)
+
+
+def iter_spilled(key, parts, columns=None):
+    # Read the first parts spilled by a session one at a time
+    for part in range(parts):
+        path = _spill_path(key, part)
+        if not os.path.exists(path):
+            return
+        yield pd.read_parquet(path, columns=columns)
+
+
+def clear_spilled(key):
+    shutil.rmtree(os.path.join(spill_dir, key), ignore_errors=True)
+
+
+def _make_dir(path):
+    # Folders of the cache are only readable by the user of the app, the default one is in the shared temp folder
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    os.makedirs(path, mode=0o700, exist_ok=True)
+
+
+def _spill_path(key, part):
+    return os.path.join(spill_dir, key, f"{part:06d}.parquet")
+
+
+def _evict():
+    # Remove least recently used files until the cache fits in the size cap
+    files = glob.glob(os.path.join(cache_dir, "*.parquet")) + glob.glob(os.path.join(snapshot_dir, "*", "*.arrow"))
+    files = sorted(files, key=os.path.getmtime)
+    total = sum(os.path.getsize(path) for path in files)
+    for path in files[:-1]:
+        if total <= cache_max_bytes:
+            break
+        total -= os.path.getsize(path)
+        os.remove(path)
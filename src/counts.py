@@ -0,0 +1,96 @@
+import copy
+import numpy as np
+import pandas as pd
+
+
+class ExponentialAverage:
+    # State of pandas ewm(span).mean() (adjusted) at every point of a series, updated from the first changed point
+    def __init__(self, span):
+        self.decay = 1 - 2 / (span + 1)
+        self.numerators = np.zeros(0)
+        self.denominators = np.zeros(0)
+
+    def update(self, values, start):
+        # Recompute the state from the position start, keeping the state before it
+        numerators = np.empty(len(values))
+        denominators = np.empty(len(values))
+        numerators[:start] = self.numerators[:start]
+        denominators[:start] = self.denominators[:start]
+        numerator = numerators[start - 1] if start > 0 else 0.0
+        denominator = denominators[start - 1] if start > 0 else 0.0
+        for i in range(start, len(values)):
+            numerator = values[i] + self.decay * numerator
+            denominator = 1 + self.decay * denominator
+            numerators[i], denominators[i] = numerator, denominator
+        self.numerators, self.denominators = numerators, denominators
+
+    def value(self, position):
+        return self.numerators[position] / self.denominators[position]
+
+
+class CompletionCounts:
+    # Completed tasks per day and week with their moving averages, updated as batches of items arrive
+    def __init__(self, start_day=1, day_span=7, week_span=13):
+        self.start_day = start_day
+        self.daily = pd.Series(dtype="int64")
+        self.weekly = pd.Series(dtype="int64")
+        self._day_average = ExponentialAverage(day_span)
+        self._week_average = ExponentialAverage(week_span)
+        self._pending = []
+
+    def add(self, items):
+        # Buffer the completion days of a batch of items, they are combined once when the counts are read
+        completed = items["completed_at"].dropna()
+        if not completed.empty:
+            self._pending.append(completed.dt.tz_localize(None).dt.normalize().value_counts())
+
+    def copy(self):
+        # Counts that are not affected by later batches
+        self._combine()
+        counts = CompletionCounts(self.start_day)
+        counts.daily, counts.weekly = self.daily, self.weekly
+        counts._day_average, counts._week_average = copy.copy(self._day_average), copy.copy(self._week_average)
+        return counts
+
+    def day_velocity(self):
+        # Average of the completed tasks per day (days with tasks) until the day before the last one
+        self._combine()
+        return self._day_average.value(-2) if self.daily.shape[0] >= 2 else None
+
+    def week_velocity(self):
+        # Average of the completed tasks per week until the week before the last one
+        self._combine()
+        return self._week_average.value(-2) if self.weekly.shape[0] >= 2 else None
+
+    def per_day(self):
+        # Count of tasks per day (only days with tasks) indexed by date
+        self._combine()
+        counts = self.daily.copy()
+        counts.index = counts.index.date
+        return counts
+
+    def per_week(self):
+        # Count of tasks per week indexed by the year and week
+        self._combine()
+        year, week = np.divmod(self.weekly.index.values, 100)
+        return pd.Series(self.weekly.values, index=pd.MultiIndex.from_arrays([year, week], names=["year", "week"]))
+
+    def _combine(self):
+        if not self._pending:
+            return
+        new = pd.concat(self._pending).groupby(level=0).sum()
+        self._pending = []
+
+        # Older days can arrive after newer ones, the averages are updated from the first day that changed
+        daily = new if self.daily.empty else self.daily.add(new, fill_value=0).astype("int64")
+        daily = daily.sort_index()
+        self._day_average.update(daily.values.astype(float), int(daily.index.searchsorted(new.index.min())))
+        self.daily = daily
+
+        # Weeks are keyed by year * 100 + the iso week of the day moved by the start day of the user
+        shifted = new.index + pd.Timedelta(days=8 - self.start_day)
+        new_weeks = new.groupby(new.index.year * 100 + shifted.isocalendar().week.values.astype("int64")).sum()
+        weekly = new_weeks if self.weekly.empty else self.weekly.add(new_weeks, fill_value=0).astype("int64")
+        weekly = weekly.sort_index()
+        self._week_average.update(weekly.values.astype(float), int(weekly.index.searchsorted(new_weeks.index.min())))
+        self.weekly = weekly
@@ -1,61 +1,422 @@
+import os
+import uuid
 import asyncio
+import weakref
+import threading
+import functools
 import requests
 import pandas as pd
-from datetime import timedelta
+from src import cache, metrics, parsing, transport
+from src.habits import HabitIndex
+from src.counts import CompletionCounts
+from src.scheduler import FOREGROUND, BACKGROUND
+
+# Column formats applied to every batch of items, calendar parts fit in small nullable integers
+STRING_COLUMNS = ["content"]
+CATEGORY_COLUMNS = ["priority", "project_name", "color", "labels"]
+INTEGER_COLUMNS = {"completed_year": "Int16", "completed_quarter": "Int8", "completed_month": "Int8",
+                   "completed_week": "Int8", "completed_day": "Int8",
+                   "due_year": "Int16", "due_quarter": "Int8", "due_month": "Int8", "due_week": "Int8",
+                   "due_day": "Int8"}
+
+# Memory budget of the items of each session, older completed items are spilled to disk above it (0 disables it)
+memory_budget_bytes = int(os.environ.get("SESSION_MEMORY_MB", 256)) * 1024 * 1024
+spill_target = 0.8
+
+# Rounds in which the windows of the history that failed are collected again
+window_retries = 1
 
 
 class DataCollector:
-    def __init__(self, token):
+    def __init__(self, token, use_cache=True):
         # Start attributes
         self.token = token
         self.current_offset = 0
-        self.items = pd.DataFrame()
         self.collecting = True
         self.user = None
+        self.from_cache = False
+        self.sync_token = "*"
+        self._projects = {}
+        self._stopped = threading.Event()
+
+        # Windows of the history that failed or were stopped, collected again by the next collection of all items
+        self._missing = []
+        self._windows_finished = False
+
+        # Offsets of the pages of completed items that failed, collected again by the next round of more items
+        self._missing_offsets = []
+
+        # Spans of the collector are tagged with the session that created it, also when run in other threads
+        self._tags = {"page": "collector", "session": metrics.tags()["session"]}
+
+        # Version of the items frame, increased every time it changes
+        self.version = 0
+
+        # Batches are buffered and combined once when the items are read
+        self._items = pd.DataFrame()
+        self._chunks = []
+        self._recurring = pd.Series(dtype="bool")
+        self._lock = threading.Lock()
+
+        # Completions per task and per day, updated with every batch including the ones spilled to disk
+        self._habits = HabitIndex()
+        self._counts = CompletionCounts()
+
+        # Oldest completed items moved to disk to keep the items within the memory budget
+        self._spill_key = uuid.uuid4().hex
+        self._spilled_parts = 0
+        self._spilled_count = 0
+        self._spilled_oldest = None
+
+        # Estimate of the memory used by the items, increased with each batch and measured again when spilling
+        self._items_bytes = 0
+        weakref.finalize(self, cache.clear_spilled, self._spill_key)
+
+        # Items published as a memory-mapped snapshot shared with the other worker processes, when idle the items are
+        # released from memory and read back from the mapping once they change
+        self._mapped = None
+        self._mapped_version = None
+
+        # Full sync
+        data = self._request_sync()
+        if data is None:
+            return
+
+        # Parse and save response
+        self.user = data["user"]
+        self._habits = HabitIndex(self.user["start_day"])
+        self._counts = CompletionCounts(self.user["start_day"])
+        self._projects = {project["id"]: project for project in data["projects"]}
+        with metrics.span("preprocess", **self._tags):
+            self._preprocess_data(data["items"], data["projects"])
+
+        # Load completed history from cache and only fetch what was completed after it
+        if use_cache:
+            self._load_cache()
+        else:
+            cache.invalidate(self.user["id"])
 
+    @property
+    def items(self):
+        with self._lock:
+            self._materialize()
+            return self._items
+
+    def snapshot(self):
+        # Items frame with its version, a reader of the items spilled to disk, the habit index and the completion
+        # counts until then
+        with self._lock:
+            self._materialize()
+            return self._items, self.version, self._spilled_history(), self._habits.copy(), self._counts.copy()
+
+    def publish(self, idle=False):
+        # Snapshot for the pages. Once the collector is idle the items are written to a shared Arrow file of this
+        # version (if enabled), memory-mapped from it and released from memory until they change. While loading they
+        # are read from memory, so the file is not written again for every window
+        items, version, history, habits, counts = self.snapshot()
+        if not idle or not cache.shared_snapshots or items.empty:
+            return items, version, history, habits, counts
+        if self._mapped_version != version:
+            try:
+                with metrics.span("publish", **self._tags):
+                    path = cache.save_snapshot(self.user, self._spill_key, version, items,
+                                               complete=self.history_complete and self._spilled_parts == 0)
+                    mapped = cache.open_snapshot(path)
+            except Exception as e:
+                print(f"Snapshot could not be shared: {e}")
+                return items, version, history, habits, counts
+            with self._lock:
+                if self._mapped_version is None or self._mapped_version < version:
+                    self._mapped, self._mapped_version = mapped, version
+
+        # The items are only released when they did not change since the snapshot
+        with self._lock:
+            if self._items is items and not self._chunks and self._mapped_version == version:
+                self._items = None
+            mapped = self._mapped if self._mapped_version == version else items
+        return mapped, version, history, habits, counts
+
+    @property
+    def history_complete(self):
+        # Every completed item was collected: all windows of the history finished with as many items as todoist reports
+        # (if it reports them), windows can finish early when a page is cut short
+        if self._missing or self._missing_offsets:
+            return False
+        total = self.user.get("completed_count")
+        if total is not None:
+            return self.completed_count >= total
+        return self._windows_finished
+
+    def sync(self):
+        # Incremental sync from the last sync token
+        data = self._request_sync()
+        if data is None:
+            return
+
+        # Apply changes of user, projects and active items
+        if data.get("user"):
+            self.user.update(data["user"])
+        self._apply_project_changes(data.get("projects", []))
+        self._apply_item_changes(data.get("items", {}), full_sync=data.get("full_sync", False))
+
+        # Items completed since the last sync are collected from the completed endpoint
+        items = self.items
+        if not items.empty and items["completed_at"].notna().any():
+            self.current_offset += self._collect_recent_items(items["completed_at"].max())
+        self._save_cache()
+
+    def _request_sync(self):
         # API request
-        url = "https://api.todoist.com/sync/v9/sync"
+        url = f"{transport.api_url}/sync/v9/sync"
         headers = {"Accept": "application/json",
-                   "Authorization": f"Bearer {token}"}
-        params = {"sync_token": "*",
+                   "Authorization": f"Bearer {self.token}"}
+        params = {"sync_token": self.sync_token,
                   "resource_types": '["user", "projects", "items"]'}
-        resp = requests.get(url, headers=headers, params=params)
+        # Items are parsed into columns while they are received
+        try:
+            resp = transport.get(url, headers=headers, params=params, key=self.token, priority=FOREGROUND, stream=True,
+                                 parse=parsing.parse_response)
+        except (requests.RequestException, ValueError) as e:
+            print(f"There was a problem during sync: {e}")
+            return None
 
         # Handle error
         if resp.status_code != 200:
             print(f"There was a problem during sync with status code {resp.status_code}.")
+            return None
+
+        # Keep the token for the next incremental sync
+        data = resp.data
+        self.sync_token = data.get("sync_token", "*")
+        return data
+
+    def _apply_project_changes(self, projects):
+        # Update known projects and find the ones renamed or recolored
+        changes = []
+        for project in projects:
+            old = self._projects.get(project["id"])
+            if project.get("is_deleted"):
+                self._projects.pop(project["id"], None)
+                continue
+            self._projects[project["id"]] = project
+            if old is not None and (old["name"], old["color"]) != (project["name"], project["color"]):
+                changes.append((old, project))
+        if not changes:
             return
 
-        # Parse and save response
-        data = resp.json()
-        self.user = data["user"]
-        self._preprocess_data(data["items"], data["projects"])
+        # Patch the name and color of the rows of those projects
+        with self._lock:
+            self._materialize()
+            items = self._items.copy(deep=False)
+            for old, new in changes:
+                mask = (items["project_name"] == old["name"]) & (items["color"] == old["color"])
+                for column, key in [("project_name", "name"), ("color", "color")]:
+                    values = items[column]
+                    if new[key] not in values.cat.categories:
+                        values = values.cat.add_categories([new[key]])
+                        values = values.cat.reorder_categories(values.cat.categories.sort_values())
+                    items[column] = values.mask(mask, new[key])
+            self._items = items
+            self.version += 1
+
+    def _apply_item_changes(self, changes, full_sync=False):
+        # Remove the active rows that changed (or every active row on a full sync), keyed by task_id
+        with self._lock:
+            self._materialize()
+            if not self._items.empty:
+                active = self._items["completed_at"].isna()
+                if not full_sync:
+                    active &= self._items["task_id"].isin([int(task_id) for task_id in changes.get("task_id", [])])
+                self._items = self._items[~active].reset_index(drop=True)
+                self.version += 1
+
+        # Add back the items that are still active
+        rows = parsing.count(changes)
+        active_items = parsing.take(changes, [not deleted and not checked for deleted, checked in
+                                              zip(changes.get("is_deleted", [None] * rows),
+                                                  changes.get("checked", [None] * rows))])
+        with metrics.span("preprocess", **self._tags):
+            self._preprocess_data(active_items, list(self._projects.values()))
+        with self._lock:
+            self._materialize()
+
+    @property
+    def completed_count(self):
+        # Completed items collected so far, in memory (or in their snapshot if released) and spilled to disk
+        with self._lock:
+            if self._items is None and not self._chunks:
+                completed = self._mapped.column("completed_at")
+                return len(completed) - completed.null_count + self._spilled_count
+        items = self.items
+        return (int(items["completed_at"].notna().sum()) if not items.empty else 0) + self._spilled_count
 
-    def collect_more_items(self):
-        asyncio.run(self._collect_batch_of_items())
+    def stop(self):
+        # Stop any collection running in the background
+        self._stopped.set()
 
-    async def _collect_batch_of_items(self, max_items: int = 1000):
-        # Create list of tasks
+    def collect_all_items(self, window_days=90, priority=BACKGROUND, on_update=None):
+        asyncio.run(self._collect_all_windows(window_days, priority, on_update))
+
+    async def _collect_all_windows(self, window_days, priority, on_update=None):
+        # History goes from the day the user joined until the oldest completed item already collected (or now)
+        oldest = self._oldest_completed()
+        collected = oldest is not None
+        end = oldest.tz_convert("UTC") if collected else pd.Timestamp.now(tz="UTC")
+        start = pd.to_datetime(self.user.get("joined_at") or "2007-01-01", utc=True)
+
+        # Split the history in time windows, newest first and open ended if nothing was collected yet
+        edges = list(pd.date_range(start=start, end=end, freq=f"{window_days}D")) + [end]
+        windows = [(since, until - pd.Timedelta(seconds=1)) for since, until in zip(edges[:-1], edges[1:])
+                   if since < until][::-1]
+        if windows and not collected:
+            windows[0] = (windows[0][0], None)
+
+        # Windows missing from an earlier collection are collected again first, they are kept as missing until the
+        # collection ends
+        windows = self._missing + windows
+
+        # Collect windows concurrently, leaving room in the transport pool for other sessions
+        semaphore = asyncio.Semaphore(max(1, transport.max_connections // 2))
+        loop = asyncio.get_running_loop()
+        executor = transport.executor_for(priority)
+
+        async def collect(since, until):
+            chunks = []
+            async with semaphore:
+                try:
+                    _, finished = await loop.run_in_executor(executor, self._collect_window, since, until, priority,
+                                                             chunks)
+                except Exception as e:
+                    # A body cut while it is read (or that can not be parsed) fails only its window
+                    print(f"Window of completed items since {since} failed: {e}")
+                    finished = False
+            return since, until, chunks, finished
+
+        # Add each window to the items as soon as it is complete, the pages of a window that failed or was stopped
+        # are dropped and the window is collected again (once here, then in the next collection)
+        for attempt in range(window_retries + 1):
+            failed = []
+            for task in asyncio.as_completed([collect(since, until) for since, until in windows]):
+                since, until, chunks, finished = await task
+                if not finished:
+                    failed.append((since, until))
+                    continue
+                with self._lock:
+                    self._chunks.extend(chunks)
+                    self._materialize()
+                if on_update is not None and chunks:
+                    on_update()
+            windows = failed
+            if not windows or self._stopped.is_set() or attempt == window_retries:
+                break
+            print(f"{len(windows)} windows of completed items failed, retrying.")
+
+        # There is nothing older left to collect unless it was stopped or some windows are still missing, the cache
+        # is only written once the history has no gaps
+        self._missing = windows
+        self.current_offset = self.completed_count
+        self.collecting = self._stopped.is_set() or bool(self._missing)
+        self._windows_finished = not self.collecting
+        self._save_cache()
+        if on_update is not None:
+            on_update()
+
+    def collect_more_items(self, priority=BACKGROUND):
+        asyncio.run(self._collect_batch_of_items(priority=priority))
+
+    async def _collect_batch_of_items(self, max_items: int = 1000, priority=BACKGROUND):
+        # Create list of tasks, pages that failed in earlier rounds go first
         step = 200
-        tasks = [self._collect_completed_items_async(step, i * step + self.current_offset)
-                 for i in range(int(max_items/step))]
+        offsets = self._missing_offsets + [i * step + self.current_offset for i in range(int(max_items/step))]
         self.current_offset += max_items
 
-        # Wait for next result and preprocess data if available
-        for task in asyncio.as_completed(tasks):
-            result = await task
-            if not result:
-                continue
-            items, projects = result
-            self._preprocess_data(items, projects)
+        # Wait for all requests, each one preprocesses its own data
+        counts = await asyncio.gather(*[self._collect_completed_items_async(step, offset, priority)
+                                        for offset in offsets])
+
+        # Keep the pages that failed to collect them again, the collection is not over while any is missing
+        self._missing_offsets = [offset for offset, count in zip(offsets, counts) if count is None]
+        if self._missing_offsets:
+            self.collecting = True
+
+        # Combine the batches of this round and update the cache
+        self._save_cache()
+
+    def _load_cache(self):
+        history = cache.load_history(self.user)
+        if history is None or history.empty:
+            return
+        categories = history["project_name"].cat.categories
+        history["project_name"] = history["project_name"].cat.rename_categories(categories.astype("string"))
+        with self._lock:
+            self._chunks.append(history)
+        self.from_cache = True
+        self.current_offset = history.shape[0] + self._collect_recent_items(history["completed_at"].max())
+        self._save_cache()
+
+    def _collect_recent_items(self, newest):
+        # Fetch items completed after the newest known item
+        return self._collect_window(newest + pd.Timedelta(seconds=1), priority=FOREGROUND)[0]
+
+    def _collect_window(self, since, until=None, priority=BACKGROUND, chunks=None):
+        # Fetch pages of items completed in the window until a short page is found, returns the items received and
+        # whether the window finished (no request failed and collection was not stopped)
+        step = 200
+        since = since.tz_convert("UTC").strftime("%Y-%m-%dT%H:%M:%S")
+        until = until.tz_convert("UTC").strftime("%Y-%m-%dT%H:%M:%S") if until is not None else None
+        received = 0
+        while not self._stopped.is_set():
+            count = self._collect_completed_items(step, received, since=since, until=until, priority=priority,
+                                                  chunks=chunks)
+            if count is None:
+                return received, False
+            received += count
+            if count < step:
+                return received, True
+        return received, False
+
+    def _oldest_completed(self):
+        items = self.items
+        oldest = items["completed_at"].min() if not items.empty else None
+        if self._spilled_oldest is not None:
+            oldest = self._spilled_oldest if pd.isnull(oldest) else min(oldest, self._spilled_oldest)
+        return None if pd.isnull(oldest) else oldest
+
+    def _spilled_history(self):
+        # Reader of the parts spilled so far, later parts are left out so the snapshot is not counted twice
+        if self._spilled_parts == 0:
+            return None
+        return functools.partial(cache.iter_spilled, self._spill_key, self._spilled_parts)
 
-    def _collect_completed_items(self, limit, offset):
+    def _save_cache(self):
+        # The history is not cached while windows or pages of it are missing, as later loads only collect newer items,
+        # or once the collector was stopped (a newer collector of the session writes it)
+        if self._missing or self._missing_offsets or self._stopped.is_set():
+            return
+        items, _, spilled, _, _ = self.snapshot()
+        if items.empty:
+            return
+        try:
+            cache.save_history(self.user, items[items["completed_at"].notna()], spilled() if spilled else ())
+        except Exception as e:
+            print(f"Completed history could not be cached: {e}")
+
+    def _collect_completed_items(self, limit, offset, since=None, until=None, priority=BACKGROUND, chunks=None):
         # API request
-        url = 'https://api.todoist.com/sync/v9/completed/get_all'
+        url = f"{transport.api_url}/sync/v9/completed/get_all"
         headers = {"Accept": "application/json",
                    "Authorization": f"Bearer {self.token}"}
         params = {"limit": limit, "offset": offset, "annotate_notes": False}
-        resp = requests.get(url, headers=headers, params=params)
+        if since:
+            params["since"] = since
+        if until:
+            params["until"] = until
+        try:
+            resp = transport.get(url, headers=headers, params=params, key=self.token, priority=priority, stream=True,
+                                 parse=parsing.parse_response)
+        except (requests.RequestException, ValueError) as e:
+            print(f"Request of completed items failed ({e}), offset {offset}")
+            return None
 
         # Handle error
         if resp.status_code != 200:
@@ -67,16 +428,22 @@ class DataCollector:
             self.collecting = False
             return
 
-        # Return data
-        data = resp.json()
-        self._preprocess_data(data["items"], data["projects"])
+        # Preprocess data and return the number of items received
+        data = resp.data
+        with metrics.span("preprocess", **self._tags):
+            self._preprocess_data(data["items"], data["projects"], chunks=chunks)
+        return parsing.count(data["items"])
 
-    async def _collect_completed_items_async(self, limit, offset):
-        return await asyncio.get_running_loop().run_in_executor(None, self._collect_completed_items, limit, offset)
+    async def _collect_completed_items_async(self, limit, offset, priority=BACKGROUND):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(transport.executor_for(priority), self._collect_completed_items, limit,
+                                          offset, None, None, priority)
 
-    def _preprocess_data(self, items, projects):
-        # Verify there's at least one new task
-        if len(items) == 0:
+    def _preprocess_data(self, items, projects, chunks=None):
+        # Verify there's at least one new task, items are columns of their fields (or a list of items)
+        if isinstance(items, list):
+            items = parsing.to_columns(items)
+        if parsing.count(items) == 0:
             return
 
         # Format Projects
@@ -85,28 +452,25 @@ class DataCollector:
         else:
             projects = pd.DataFrame(projects.values(), index=projects.keys()).reset_index()
             projects = projects.rename(columns={"index": "project_id"})
-            projects["project_name"] = projects.apply(lambda x: x["project_id"] if x["name"] == '' else x["name"],
-                                                      axis=1)
+            projects["project_name"] = projects["name"].mask(projects["name"] == '', projects["project_id"])
         projects = projects[["project_id", "project_name", "color"]]
 
-        # Transform items data into a DataFrame
+        # Transform the columns of the items into a DataFrame
         items = pd.DataFrame(items)
 
-        # Use id as tasks_id if not provided
-        if "task_id" not in items.columns.values.tolist():
-            items = items.rename(columns={"id": "task_id"})
-
-        # Format due_date and recurring data (or enhance it if possible)
-        if "due" in items.columns.values.tolist():
-            items["due_date"] = items["due"].apply(lambda x: x["date"] if x else None)
-            items["recurring"] = items["due"].apply(lambda x: x["is_recurring"] if x else False)
+        # Format recurring data of items with a due date (or enhance it if possible)
+        if "recurring" in items.columns.values.tolist():
+            items["recurring"] = items["recurring"].fillna(False)
+            with self._lock:
+                self._recurring = pd.concat([items.set_index("task_id")["recurring"], self._recurring])
+                self._recurring = self._recurring[~self._recurring.index.duplicated()]
         else:
-            items = items.merge(self.items[["task_id", "recurring"]].drop_duplicates(), how="left", on="task_id")
+            items["recurring"] = items["task_id"].map(self._recurring)
 
         # Set default priority to 0 if not provided then, add format
         if "priority" not in items.columns.values.tolist():
             items["priority"] = 0
-        items["priority"] = items["priority"].apply(lambda x: "Priority {}".format(x))
+        items["priority"] = pd.Categorical(items["priority"]).rename_categories(lambda x: "Priority {}".format(x))
 
         # Create missing columns when not present
         column_names = ["task_id", "content", "priority", "project_id", "recurring",
@@ -122,32 +486,92 @@ class DataCollector:
 
         # Format dates using timezone
         timezone = self.user["tz_info"]["timezone"]
-        items["completed_at"] = pd.to_datetime(items["completed_at"], utc=True).map(lambda x: x.tz_convert(timezone))
-        items["added_at"] = pd.to_datetime(items["added_at"], utc=True).map(lambda x: x.tz_convert(timezone))
-        items["due_date"] = pd.to_datetime(items["due_date"], utc=True).map(lambda x: x.tz_convert(timezone))
+        for column in ["completed_at", "added_at", "due_date"]:
+            items[column] = pd.to_datetime(items[column], utc=True).dt.tz_convert(timezone)
 
         # Enhance the dataframe with year, quarter, month, week, day
-        start_day = 8 - self.user["start_day"]
-        items["completed_year"] = items["completed_at"].dt.year
-        items["completed_quarter"] = items["completed_at"].dt.quarter
-        items["completed_month"] = items["completed_at"].dt.month
-        items["completed_week"] = items["completed_at"].dt.date.map(lambda x: None if pd.isnull(x) else (x + timedelta(
-            days=start_day)).isocalendar()[1])
-        items["completed_day"] = items['completed_at'].dt.day
-        items["due_year"] = items["due_date"].dt.year
-        items["due_quarter"] = items["due_date"].dt.quarter
-        items["due_month"] = items["due_date"].dt.month
-        items["due_week"] = items["due_date"].dt.date.map(lambda x: None if pd.isnull(x) else (x + timedelta(
-            days=start_day)).isocalendar()[1])
-        items["due_day"] = items['due_date'].dt.day
-
-        # Combine all tasks in one dataframe and format columns
-        self.items = pd.concat([items, self.items], axis=0, ignore_index=True)
-        self.items["recurring"] = self.items["recurring"].astype("bool")
-        for column in ["task_id", "content", "project_name"]:
-            self.items[column] = self.items[column].astype("string")
-        for column in ["priority", "project_name", "color"]:
-            self.items[column] = self.items[column].astype("category")
-        for column in ["completed_year", "completed_quarter", "completed_month", "completed_week", "completed_day",
-                       "due_year", "due_quarter", "due_month", "due_week", "due_day"]:
-            self.items[column] = self.items[column].astype("Int64")
+        start_day = pd.Timedelta(days=8 - self.user["start_day"])
+        for prefix, column in [("completed", "completed_at"), ("due", "due_date")]:
+            dates = items[column].dt
+            items[f"{prefix}_year"] = dates.year
+            items[f"{prefix}_quarter"] = dates.quarter
+            items[f"{prefix}_month"] = dates.month
+            items[f"{prefix}_week"] = (dates.tz_localize(None).dt.normalize() + start_day).dt.isocalendar().week
+            items[f"{prefix}_day"] = dates.day
+
+        # Format columns of the new batch only and add it to the buffer (or the given list of chunks)
+        items["recurring"] = items["recurring"].astype("bool")
+        items["task_id"] = pd.to_numeric(items["task_id"]).astype("int64")
+        items["labels"] = items["labels"].str.join(", ").fillna("")
+        for column in STRING_COLUMNS + ["project_name"]:
+            items[column] = items[column].astype("string")
+        for column in CATEGORY_COLUMNS:
+            items[column] = items[column].astype("category")
+        for column, dtype in INTEGER_COLUMNS.items():
+            items[column] = items[column].astype(dtype)
+        with self._lock:
+            (self._chunks if chunks is None else chunks).append(items)
+
+    def _materialize(self):
+        # Items released from memory are read back from their snapshot before they change
+        if self._items is None:
+            items = self._mapped.to_pandas()
+            categories = items["project_name"].cat.categories
+            items["project_name"] = items["project_name"].cat.rename_categories(categories.astype("string"))
+            self._items = items
+            self._items_bytes = items.memory_usage(deep=True).sum()
+        if not self._chunks:
+            return
+
+        with metrics.span("combine", **self._tags):
+            # Add the completions of the new batches to the habit index and the completion counts
+            for chunk in self._chunks:
+                self._habits.add(chunk)
+                self._counts.add(chunk)
+                self._items_bytes += chunk.memory_usage(deep=True).sum()
+
+            # Newest batches go first, as they were collected after the existing items
+            frames = self._chunks[::-1] + ([self._items.copy(deep=False)] if not self._items.empty else [])
+            self._chunks = []
+
+            # Union the categories so the concatenation keeps the category dtypes
+            for column in CATEGORY_COLUMNS:
+                categories = frames[0][column].cat.categories
+                for frame in frames[1:]:
+                    categories = categories.union(frame[column].cat.categories)
+                categories = categories.sort_values()
+                for frame in frames:
+                    if not frame[column].cat.categories.equals(categories):
+                        frame[column] = frame[column].cat.set_categories(categories)
+
+            self._items = pd.concat(frames, axis=0, ignore_index=True)
+            self._spill()
+            self.version += 1
+
+    def _spill(self):
+        # Move the oldest completed items to disk until the items are back under the memory budget
+        if memory_budget_bytes <= 0 or self._items_bytes <= memory_budget_bytes:
+            return
+
+        # The estimate grows with every batch and counts their categories more than once, the items are only measured
+        # when it is above the budget
+        usage = self._items.memory_usage(deep=True).sum()
+        self._items_bytes = usage
+        if usage <= memory_budget_bytes:
+            return
+        rows = int(self._items.shape[0] * (1 - spill_target * memory_budget_bytes / usage))
+        oldest = self._items["completed_at"].dropna().sort_values().head(rows)
+        if oldest.empty:
+            return
+        try:
+            cache.spill(self._spill_key, self._spilled_parts, self._items.loc[oldest.index])
+        except Exception as e:
+            print(f"Items could not be spilled to disk: {e}")
+            return
+
+        self._spilled_parts += 1
+        self._spilled_count += oldest.shape[0]
+        self._spilled_oldest = oldest.iloc[0] if self._spilled_oldest is None else min(oldest.iloc[0],
+                                                                                        self._spilled_oldest)
+        self._items = self._items.drop(oldest.index).reset_index(drop=True)
+        self._items_bytes = usage * self._items.shape[0] / (self._items.shape[0] + oldest.shape[0])
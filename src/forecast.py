@@ -0,0 +1,148 @@
+import os
+import hashlib
+import threading
+import multiprocessing
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from src import metrics
+
+# Forecaster settings: "prophet" or "ema" (seasonal exponential moving average)
+forecaster = os.environ.get("FORECASTER", "prophet")
+max_prophet_days = int(os.environ.get("FORECAST_MAX_PROPHET_DAYS", 3000))
+forecast_workers = int(os.environ.get("FORECAST_WORKERS", 1))
+cache_size = int(os.environ.get("FORECAST_CACHE_SIZE", 64))
+wait_seconds = float(os.environ.get("FORECAST_WAIT_SECONDS", 2))
+
+# Forecasts shared by every session of this process, keyed by a hash of the series and parameters, and the key of the
+# latest forecast of each session
+_cache = OrderedDict()
+_latest = OrderedDict()
+_lock = threading.Lock()
+_pool = None
+
+
+def submit(counts, periods=7, changepoint_prior_scale=2.0, session=None):
+    # Returns a future with the forecast of the daily counts, reusing previous fits of the same data
+    method = "ema" if forecaster == "ema" or counts.shape[0] > max_prophet_days else "prophet"
+    key = _key(counts, method, periods, changepoint_prior_scale)
+    session = session or metrics.tags()["session"]
+    with _lock:
+        # A newer forecast of the session supersedes its previous one, which is cancelled if nobody else needs it
+        previous = _latest.pop(session, None)
+        _latest[session] = key
+        while len(_latest) > 1000:
+            _latest.popitem(last=False)
+        if previous is not None and previous != key and previous not in _latest.values() and previous in _cache:
+            _cancel(_cache.pop(previous))
+
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+        # Fit in the process pool, or right away for the fast forecaster
+        ds, y = list(counts.index), counts.values.astype(float)
+        if method == "prophet":
+            future = _get_pool().submit(prophet_forecast, ds, y, periods, changepoint_prior_scale)
+        else:
+            future = Future()
+            future.set_result(ema_forecast(ds, y, periods))
+        _cache[key] = future
+        while len(_cache) > cache_size:
+            _cancel(_cache.popitem(last=False)[1])
+    return future
+
+
+def result(future, counts, periods=7, timeout=None):
+    # Result of the forecast, or the fast forecast if the fit is not ready in time (marked as pending, the fit goes on
+    # for the next run) or failed
+    global _pool
+    try:
+        with metrics.span("forecast"):
+            return future.result(timeout=wait_seconds if timeout is None else timeout)
+    except TimeoutError:
+        return dict(fast_forecast(counts, periods), pending=True)
+    except Exception as e:
+        print(f"Forecast failed ({e}), using the fast forecaster.")
+        with _lock:
+            for key in [k for k, f in _cache.items() if f is future]:
+                del _cache[key]
+            if isinstance(e, BrokenProcessPool):
+                _pool = None
+        return fast_forecast(counts, periods)
+
+
+def warm_up():
+    # Start the worker processes and import prophet in them before the first forecast
+    if forecaster == "prophet":
+        with _lock:
+            for _ in range(forecast_workers):
+                _get_pool().submit(_import_prophet)
+
+
+def _import_prophet():
+    import prophet
+    return prophet.__version__
+
+
+def fast_forecast(counts, periods=7):
+    # Forecast to show while the fit is pending
+    return ema_forecast(list(counts.index), counts.values.astype(float), periods)
+
+
+def recommended_goals(forecast, days_off, periods=7):
+    # Daily goal excludes days off, weekly goal is the whole forecast of the next week
+    prediction = forecast[["ds", "trend", "yhat"]].tail(periods).copy()
+    prediction["yhat"] = prediction["yhat"].where(prediction["yhat"] > 0.0, prediction["trend"])
+    day_of_the_week = prediction["ds"].dt.weekday + 1
+    return prediction[~day_of_the_week.isin(days_off)]["yhat"].mean(), prediction["yhat"].sum()
+
+
+def prophet_forecast(ds, y, periods, changepoint_prior_scale):
+    # Runs in a worker process, so prophet is only imported there
+    from prophet import Prophet
+    m = Prophet(changepoint_prior_scale=changepoint_prior_scale)
+    m.fit(pd.DataFrame({"ds": pd.to_datetime(ds), "y": y}))
+    forecast = m.predict(m.make_future_dataframe(periods=periods))
+    changepoints = m.changepoints[np.abs(np.nanmean(m.params["delta"], axis=0)) >= 0.01]
+    forecast = forecast[["ds", "trend", "yhat", "yhat_lower", "yhat_upper"]]
+    return {"method": "prophet", "forecast": forecast, "changepoints": list(changepoints)}
+
+
+def ema_forecast(ds, y, periods, span=7, seasonal_span=8):
+    # Trend is the EMA of the counts and each weekday is forecast with the EMA of the same weekday
+    history = pd.Series(y, index=pd.to_datetime(ds))
+    trend = history.ewm(span=span).mean()
+    seasonal = history.groupby(history.index.weekday).transform(lambda x: x.ewm(span=seasonal_span).mean())
+    last_by_weekday = seasonal.groupby(seasonal.index.weekday).last()
+
+    # Forecast of the next days and a band based on the residuals
+    future_ds = pd.date_range(history.index.max() + pd.Timedelta(days=1), periods=periods, freq="D")
+    future_yhat = [last_by_weekday.get(day.weekday(), trend.iloc[-1]) for day in future_ds]
+    band = 1.28 * (history - seasonal).std() if history.shape[0] > 1 else 0.0
+    forecast = pd.DataFrame({"ds": list(history.index) + list(future_ds),
+                             "trend": list(trend.values) + [trend.iloc[-1]] * periods,
+                             "yhat": list(seasonal.values) + future_yhat})
+    forecast["yhat_lower"] = forecast["yhat"] - band
+    forecast["yhat_upper"] = forecast["yhat"] + band
+    return {"method": "ema", "forecast": forecast, "changepoints": []}
+
+
+def _cancel(future):
+    # Fits still queued are dropped, a running one finishes and its result is discarded
+    future.cancel()
+
+
+def _key(counts, *params):
+    digest = hashlib.md5(pd.util.hash_pandas_object(counts, index=True).values.tobytes())
+    digest.update(repr(params).encode())
+    return digest.hexdigest()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=forecast_workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
@@ -0,0 +1,103 @@
+from datetime import date
+import numpy as np
+import pandas as pd
+
+
+class HabitIndex:
+    # Completions per task and day, updated as batches of items arrive, habits are tasks completed at least twice
+    def __init__(self, start_day=1):
+        self.start_day = start_day
+        self._days = pd.DataFrame({"task_id": pd.Series(dtype="int64"),
+                                   "day": pd.Series(dtype="datetime64[ns]"),
+                                   "count": pd.Series(dtype="int64")})
+        self._content = pd.Series(dtype="string")
+        self._pending = []
+        self._summary = None
+
+    def add(self, items):
+        # Buffer the completions of a batch of items, they are combined once when the index is read
+        completed = items[items["completed_at"].notna()]
+        if completed.empty:
+            return
+        days = completed["completed_at"].dt.tz_localize(None).dt.normalize()
+        self._pending.append(pd.DataFrame({"task_id": completed["task_id"].to_numpy(),
+                                           "day": days.to_numpy(),
+                                           "content": completed["content"].to_numpy()}))
+
+    def copy(self):
+        # Index that is not affected by later batches, both share the completions combined so far
+        self._combine()
+        index = HabitIndex(self.start_day)
+        index._days, index._content, index._summary = self._days, self._content, self._summary
+        return index
+
+    @property
+    def ids(self):
+        summary = self.summary
+        return summary.index[summary["count"] >= 2]
+
+    @property
+    def summary(self):
+        # Completions, first and last completion day and weekly streaks of every completed task
+        self._combine()
+        if self._summary is None:
+            self._summary = self._summarize()
+        return self._summary
+
+    def habits(self, today=None):
+        # Summary of the habits with the content of the task and the weeks of their current streak
+        today = date.today() if today is None else today
+        summary = self.summary
+        summary = summary[summary["count"] >= 2].copy()
+
+        # Current streak is kept alive if the task was completed this week or the last one
+        alive = summary["last_week"] >= self._week(np.datetime64(today, "D")) - 1
+        summary["current_streak"] = summary["last_streak"].where(alive, 0)
+        summary["content"] = self._content.reindex(summary.index)
+        return summary.drop(columns=["last_week", "last_streak"])
+
+    def _combine(self):
+        if not self._pending:
+            return
+        new = pd.concat(self._pending, ignore_index=True)
+        self._pending = []
+
+        # Latest content of each task and count of completions per task and day
+        self._content = pd.concat([self._content, new.groupby("task_id")["content"].last().astype("string")])
+        self._content = self._content[~self._content.index.duplicated(keep="last")]
+        new = new.groupby(["task_id", "day"]).size().rename("count").reset_index()
+        self._days = pd.concat([self._days, new], ignore_index=True)\
+            .groupby(["task_id", "day"])["count"].sum().reset_index()
+        self._summary = None
+
+    def _week(self, days):
+        # Week number since the epoch with weeks starting on the start day of the user (1970-01-01 was a Thursday)
+        shifted = days.astype("datetime64[D]") + np.timedelta64(8 - self.start_day, "D")
+        return (shifted.astype("int64") + 3) // 7
+
+    def _summarize(self):
+        days = self._days
+        if days.empty:
+            return pd.DataFrame(columns=["count", "first", "last", "last_week", "last_streak", "longest_streak",
+                                         "consistency"], index=pd.Index([], name="task_id", dtype="int64"))
+        by_task = days.groupby("task_id")
+        summary = pd.DataFrame({"count": by_task["count"].sum(),
+                                "first": by_task["day"].min(),
+                                "last": by_task["day"].max()})
+
+        # Runs of consecutive weeks with at least one completion of each task
+        weeks = pd.DataFrame({"task_id": days["task_id"].to_numpy(),
+                              "week": self._week(days["day"].to_numpy())}).drop_duplicates()\
+            .sort_values(["task_id", "week"], ignore_index=True)
+        new_run = (weeks["task_id"].diff() != 0) | (weeks["week"].diff() != 1)
+        runs = weeks.assign(run=new_run.cumsum()).groupby("run")\
+            .agg(task_id=("task_id", "first"), last_week=("week", "last"), length=("week", "size"))
+        by_run = runs.groupby("task_id")
+        summary["last_week"] = by_run["last_week"].last()
+        summary["last_streak"] = by_run["length"].last()
+        summary["longest_streak"] = by_run["length"].max()
+
+        # Share of the weeks between the first and the last completion with at least one completion
+        by_week = weeks.groupby("task_id")["week"]
+        summary["consistency"] = by_week.size() / (by_week.max() - by_week.min() + 1)
+        return summary
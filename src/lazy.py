@@ -0,0 +1,39 @@
+import sys
+import importlib
+import threading
+from src import metrics
+
+
+class LazyModule:
+    # Module imported the first time one of its attributes is used
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = load(self._name)
+        return getattr(self._module, attribute)
+
+
+def load(name):
+    # Import a module timing it the first time, always through importlib so a module being imported by another thread
+    # (as when preloading) is waited for instead of used half initialized
+    if name in sys.modules:
+        return importlib.import_module(name)
+    with metrics.span(f"import {name}"):
+        return importlib.import_module(name)
+
+
+def preload(*names):
+    # Import modules in a background thread so they are ready when first used
+    def load_all():
+        for name in names:
+            try:
+                load(name)
+            except Exception as e:
+                print(f"Module {name} could not be preloaded: {e}")
+
+    thread = threading.Thread(target=load_all, daemon=True, name="preload")
+    thread.start()
+    return thread
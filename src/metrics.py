@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import threading
+import contextlib
+from collections import deque, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Export settings: a JSON lines file of every span, a port serving the totals as prometheus text (0 disables it)
+# and the duration of a page run that is logged with its breakdown
+metrics_file = os.environ.get("METRICS_FILE")
+metrics_port = int(os.environ.get("METRICS_PORT", 0))
+slow_run_seconds = float(os.environ.get("SLOW_RUN_SECONDS", 5))
+history_size = int(os.environ.get("METRICS_HISTORY", 10000))
+
+# Spans of every session of this process, the page and session of the run of each thread and the totals per stage
+_spans = deque(maxlen=history_size)
+_context = threading.local()
+_totals = defaultdict(lambda: [0, 0.0])
+_lock = threading.Lock()
+_server = None
+
+# Functions returning the current values of gauges by name, as the queues of the scheduler
+_gauges = {}
+
+
+def tags():
+    # Page and session of the run of this thread, to tag the spans of work done for it in other threads
+    return {"page": getattr(_context, "page", None) or "background", "session": getattr(_context, "session", None)}
+
+
+@contextlib.contextmanager
+def span(stage, page=None, session=None):
+    # Time a stage of the work, tagged with the page and session of the current run unless given
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start, page, session)
+
+
+def record(stage, seconds, page=None, session=None):
+    current = tags()
+    entry = {"ts": time.time(), "page": page or current["page"], "session": session or current["session"],
+             "stage": stage, "seconds": seconds}
+    with _lock:
+        _spans.append(entry)
+        totals = _totals[(entry["page"], stage)]
+        totals[0] += 1
+        totals[1] += seconds
+        if metrics_file:
+            with open(metrics_file, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+    if getattr(_context, "run", None) is not None and entry["session"] == current["session"]:
+        _context.run.append(entry)
+
+
+@contextlib.contextmanager
+def run(page, session=None):
+    # Spans of one run of a page, the run is logged with its breakdown when it is slow
+    _context.page, _context.session, _context.run = page, session, []
+    _start_server()
+    try:
+        with span("run"):
+            yield _context.run
+    finally:
+        spans = _context.run
+        _context.page, _context.session, _context.run = None, None, None
+    total = spans[-1]["seconds"]
+    if total >= slow_run_seconds:
+        print(f"Slow run of {page} ({total:.2f}s) for session {session}: " +
+              ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in breakdown(spans).items()))
+
+
+def breakdown(spans):
+    # Seconds per stage, slowest first
+    seconds = defaultdict(float)
+    for entry in spans:
+        seconds[entry["stage"]] += entry["seconds"]
+    return dict(sorted(seconds.items(), key=lambda item: item[1], reverse=True))
+
+
+def recent(session=None, limit=200):
+    # Latest spans of a session (or of every session)
+    with _lock:
+        spans = [entry for entry in _spans if session is None or entry["session"] == session]
+    return spans[-limit:]
+
+
+def register(prefix, values):
+    # Expose the values returned by a function (a dict of numbers) as gauges named with the prefix
+    _gauges[prefix] = values
+
+
+def gauges():
+    # Current value of every registered gauge
+    return {f"{prefix}_{name}": value for prefix, values in list(_gauges.items()) for name, value in values().items()}
+
+
+def prometheus():
+    # Count and total seconds of every stage per page and the gauges in the prometheus text format
+    lines = ["# HELP task_analytics_stage_seconds Time spent in each stage of the work.",
+             "# TYPE task_analytics_stage_seconds summary"]
+    with _lock:
+        totals = sorted(_totals.items())
+    for (page, stage), (count, seconds) in totals:
+        labels = f'page="{page}",stage="{stage}"'
+        lines.append(f"task_analytics_stage_seconds_count{{{labels}}} {count}")
+        lines.append(f"task_analytics_stage_seconds_sum{{{labels}}} {seconds:.6f}")
+    for name, value in sorted(gauges().items()):
+        lines.append(f"# TYPE task_analytics_{name} gauge")
+        lines.append(f"task_analytics_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = prometheus().encode() if self.path.rstrip("/") in ("", "/metrics") else b""
+        self.send_response(200 if body else 404)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_server():
+    # Serve the totals once per process, in a background thread
+    global _server
+    if metrics_port <= 0 or _server is not None:
+        return
+    with _lock:
+        if _server is not None:
+            return
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", metrics_port), _Handler)
+        except OSError as e:
+            print(f"Metrics could not be served on port {metrics_port}: {e}")
+            _server = False
+            return
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
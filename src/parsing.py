@@ -0,0 +1,156 @@
+import json
+import codecs
+
+# Fields of the items kept in columns, the due date and recurrence come from the due object of active items
+ITEM_KEYS = ["task_id", "id", "content", "priority", "project_id", "labels", "added_at", "completed_at", "checked",
+             "is_deleted"]
+WHITESPACE = " \t\n\r"
+NUMBER_CHARACTERS = "0123456789+-.eE"
+chunk_size = 64 * 1024
+
+_decoder = json.JSONDecoder()
+
+
+class ItemColumns:
+    # Needed fields of a list of items as columns, keys missing from every item are left out
+    def __init__(self):
+        self.columns = {key: [] for key in ITEM_KEYS + ["due_date", "recurring"]}
+        self.present = set()
+
+    def append(self, item):
+        columns = self.columns
+        for key in ITEM_KEYS:
+            if key in item:
+                self.present.add(key)
+            columns[key].append(item.get(key))
+        if "due" in item:
+            self.present.update(["due_date", "recurring"])
+        due = item.get("due")
+        columns["due_date"].append(due.get("date") if due else None)
+        columns["recurring"].append(due.get("is_recurring") if due else None)
+
+    def result(self):
+        # Items without task_id are identified by their id, as active items are
+        columns = {key: values for key, values in self.columns.items() if key in self.present}
+        if "task_id" not in columns and "id" in columns:
+            columns["task_id"] = columns["id"]
+        columns.pop("id", None)
+        return columns
+
+
+def to_columns(items):
+    # Columns of a list of items already parsed
+    builder = ItemColumns()
+    for item in items:
+        builder.append(item)
+    return builder.result()
+
+
+def count(columns):
+    return len(columns["task_id"]) if "task_id" in columns else 0
+
+
+def take(columns, mask):
+    # Rows of the columns where the mask is true
+    return {key: [value for value, keep in zip(values, mask) if keep] for key, values in columns.items()}
+
+
+def parse_response(resp, array_key="items"):
+    # Body of a response streamed, with the items parsed one at a time into columns
+    return parse(resp.iter_content(chunk_size=chunk_size), array_key)
+
+
+def parse(chunks, array_key="items"):
+    # Top level object of a JSON document given in chunks of bytes, the array of items is stored as columns
+    reader = _Reader(chunks)
+    data = {}
+    reader.expect("{")
+    while True:
+        char = reader.peek()
+        if char == "}":
+            break
+        if char == ",":
+            reader.advance()
+            continue
+        key = reader.value()
+        reader.expect(":")
+        if key == array_key and reader.peek() == "[":
+            data[key] = reader.items()
+        else:
+            data[key] = reader.value()
+    return data
+
+
+class _Reader:
+    # Decodes JSON values from a stream keeping only the text not parsed yet
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._position = 0
+        self._done = False
+
+    def _fill(self):
+        # Read the next chunk, returns False at the end of the stream
+        for chunk in self._chunks:
+            if chunk:
+                self._buffer = self._buffer[self._position:] + self._text.decode(chunk)
+                self._position = 0
+                return True
+        if not self._done:
+            self._done = True
+            self._buffer = self._buffer[self._position:] + self._text.decode(b"", final=True)
+            self._position = 0
+        return False
+
+    def peek(self):
+        # Next character that is not whitespace
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position] in WHITESPACE:
+                self._position += 1
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._fill():
+                raise ValueError("Unexpected end of the response")
+
+    def advance(self):
+        self._position += 1
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' in the response at '{self._buffer[self._position:][:20]}'")
+        self.advance()
+
+    def value(self):
+        # A value ending at the end of the buffer may be cut, as a number followed only by number characters (like
+        # "-1." before "5"), so it is decoded again with more text
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            if (end == len(self._buffer) or self._number_continues(value, end)) and self._fill():
+                continue
+            self._position = end
+            return value
+
+    def _number_continues(self, value, end):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        return all(char in NUMBER_CHARACTERS for char in self._buffer[end:])
+
+    def items(self):
+        builder = ItemColumns()
+        self.expect("[")
+        while True:
+            char = self.peek()
+            if char == "]":
+                self.advance()
+                return builder.result()
+            if char == ",":
+                self.advance()
+                continue
+            builder.append(self.value())
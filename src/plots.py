@@ -1,6 +1,72 @@
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import july
+import os
+import io
+import hashlib
+import threading
+import pandas as pd
+from collections import OrderedDict
+from src import metrics
+from src.lazy import LazyModule, preload
+
+# Plotting libraries are imported the first time a chart is rendered (or preloaded after the first page)
+plt = LazyModule("matplotlib.pyplot")
+mdates = LazyModule("matplotlib.dates")
+july = LazyModule("july")
+
+# Rendered figures shared by every session of this process, keyed by a hash of the plot inputs
+render_cache_size = int(os.environ.get("PLOT_CACHE_SIZE", 128))
+_render_cache = OrderedDict()
+_render_lock = threading.RLock()
+
+
+def plot_image(plot, *args, image_format="png", **kwargs):
+    # Returns the image of the plot, rendered only if its inputs changed since the last time
+    key = _content_key(plot.__name__, image_format, args, kwargs)
+    with _render_lock:
+        if key in _render_cache:
+            _render_cache.move_to_end(key)
+            return _render_cache[key]
+
+        # Pyplot is not thread safe, so figures are rendered and closed while holding the lock
+        with metrics.span(f"plot {plot.__name__}"):
+            fig = plot(*args, **kwargs)[0]
+            try:
+                image = io.BytesIO()
+                fig.savefig(image, format=image_format, bbox_inches="tight", dpi=200)
+            finally:
+                plt.close(fig)
+
+        _render_cache[key] = image.getvalue()
+        while len(_render_cache) > render_cache_size:
+            _render_cache.popitem(last=False)
+        return _render_cache[key]
+
+
+def warm_up():
+    # Import the plotting libraries in the background
+    return preload("matplotlib.pyplot", "matplotlib.dates", "july")
+
+
+def _content_key(*values):
+    digest = hashlib.md5()
+    for value in values:
+        _update_digest(digest, value)
+    return digest.hexdigest()
+
+
+def _update_digest(digest, value):
+    # Pandas objects are hashed by content, containers item by item and anything else by its representation
+    if isinstance(value, (pd.Series, pd.DataFrame, pd.Index)):
+        labels = list(value.columns) if isinstance(value, pd.DataFrame) else value.name
+        digest.update(repr((type(value).__name__, labels)).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=not isinstance(value, pd.Index)).values.tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _update_digest(digest, item)
+    elif isinstance(value, dict):
+        _update_digest(digest, sorted(value.items(), key=lambda item: str(item[0])))
+    else:
+        digest.update(repr(value).encode())
 
 
 def histogram(data):
@@ -32,9 +98,8 @@ def heatmap_plot(counts):
     return ax.figure, ax
 
 
-def category_pie(data, category):
-    tasks_per_project_counts = data[category].value_counts()
-    tasks_per_project_counts = tasks_per_project_counts[tasks_per_project_counts > 0]
+def category_pie(counts):
+    tasks_per_project_counts = counts[counts > 0]
     percent = ["{} ({:.0%})".format(name, val) for name, val in
                zip(tasks_per_project_counts.index, tasks_per_project_counts.values / tasks_per_project_counts.sum())]
     fig, ax = plt.subplots(figsize=(6, 4), dpi=100)
@@ -44,9 +109,8 @@ def category_pie(data, category):
     return fig, ax
 
 
-def category_plot(data, category):
-    tasks_per_project_counts = data[category].value_counts()
-    tasks_per_project_counts = tasks_per_project_counts[tasks_per_project_counts > 0]
+def category_plot(counts):
+    tasks_per_project_counts = counts[counts > 0]
     fig, ax = plt.subplots(figsize=(6, 4), dpi=100)
     ax.bar(tasks_per_project_counts.index, tasks_per_project_counts.values)
     return fig, ax
@@ -65,3 +129,18 @@ def plot_with_average(data, x_label="", y_label="", figsize=(15, 3), labelrotati
     ax.legend(["Total", "Average ({})".format(round(mean, 1))])
     ax.grid(visible=True)
     return fig, ax
+
+
+def forecast_plot(history, forecast, changepoints):
+    fig, ax = plt.subplots(figsize=(10, 6), dpi=100)
+    ax.plot(pd.to_datetime(history.index), history.values, 'k.')
+    ax.plot(forecast["ds"], forecast["yhat"], ls='-', c='#0072B2')
+    ax.fill_between(forecast["ds"], forecast["yhat_lower"], forecast["yhat_upper"], color='#0072B2', alpha=0.2)
+    ax.plot(forecast["ds"], forecast["trend"], c='r')
+    for changepoint in changepoints:
+        ax.axvline(changepoint, c='r', ls='--')
+    ax.set_xlabel("ds")
+    ax.set_ylabel("y")
+    ax.grid(visible=True, which='major', c='gray', ls='-', lw=1, alpha=0.2)
+    fig.tight_layout()
+    return fig, ax
@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import math
+import argparse
+import multiprocessing
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from src import cache, forecast
+from src.data import DataCollector
+from src.store import TaskStore
+from src.aggregates import TaskCube
+from src.counts import CompletionCounts
+
+# Settings of the users of cached histories, as they are not stored with them (the start day is found from the name of
+# the file when possible), the summary lists the ones used
+DEFAULT_USER = {"start_day": 1, "days_off": [6, 7], "daily_goal": 0, "weekly_goal": 0}
+
+
+def summarize(items, user, history=None, habits=None, counts=None, today=None, use_prophet=False):
+    # Velocity, recommended goals, habits, plan of the week and oldest tasks of a user, as shown by the pages
+    today = date.today() if today is None else today
+    if counts is None:
+        counts = CompletionCounts(user["start_day"])
+        counts.add(items)
+        for frame in history(columns=["completed_at"]) if history is not None else []:
+            counts.add(frame)
+    tasks = TaskStore(items, history=history, habits=habits, counts=counts, start_day=user["start_day"])
+    cube = TaskCube(tasks.frame, tasks.history, tasks.start_day, tasks.habits)
+    summary = {"user_id": user["id"], "date": today.isoformat(), "tasks": cube.totals(),
+               "completed": cube.totals(completed=True), "active": cube.totals(active=True)}
+
+    # Productivity: velocity and recommended goals from the forecast of the next week
+    per_day = counts.per_day().rename("count")
+    if counts.day_velocity() is not None and counts.week_velocity() is not None:
+        summary["day_velocity"] = float(counts.day_velocity())
+        summary["week_velocity"] = float(counts.week_velocity())
+        ds, y = list(per_day.index), per_day.values.astype(float)
+        result = forecast.prophet_forecast(ds, y, 7, 2.0) if use_prophet else forecast.ema_forecast(ds, y, 7)
+        daily_goal, weekly_goal = forecast.recommended_goals(result["forecast"], user["days_off"])
+        summary["forecast"] = result["method"]
+        summary["recommended_daily_goal"] = float(daily_goal)
+        summary["recommended_weekly_goal"] = float(weekly_goal)
+
+    # Habits: share of the completed tasks that are habits in the periods of today and the streaks
+    for period in ["week", "month", "quarter"]:
+        completed = cube.count(period=period, anchor_date=today)
+        completed_habits = cube.count(habit=True, period=period, anchor_date=today)
+        summary[f"{period}_completed"] = completed
+        summary[f"{period}_habit_ratio"] = completed_habits / completed if completed > 0 else None
+    streaks = cube.habits.habits(today)
+    summary["habits"] = int(streaks.shape[0])
+    summary["active_streaks"] = int((streaks["current_streak"] > 0).sum())
+    summary["longest_streak"] = int(streaks["longest_streak"].max()) if not streaks.empty else 0
+    summary["habit_consistency"] = float(streaks["consistency"].mean()) if not streaks.empty else None
+
+    # Planning: tasks completed or due this week compared with the weekly goal
+    due = tasks.slice("week", today, "due_date", ["completed_at"])
+    planned = cube.count(period="week", anchor_date=today) + int(due["completed_at"].isna().sum())
+    summary["week_planned"] = planned
+    summary["week_tasks_left"] = max(user.get("weekly_goal", 0) - planned, 0)
+
+    # Work in progress and oldest active tasks
+    active = tasks.select(["added_at", "project_name", "labels", "content", "task_id"],
+                          rows=tasks.column("added_at").notna() & tasks.column("due_date").isna() &
+                          ~tasks.column("recurring"))
+    added_at = active["added_at"]
+    active["age_in_days"] = (pd.Timestamp(today, tz=added_at.dt.tz) - added_at.dt.normalize()).dt.days
+    summary["work_in_progress"], summary["average_age"] = tasks.work_in_progress(today)
+    if summary.get("day_velocity"):
+        summary["lead_time"] = summary["work_in_progress"] / summary["day_velocity"]
+    oldest = active.nlargest(10, "age_in_days")
+    return summary, {"daily": per_day.rename_axis("date").reset_index(), "oldest": oldest.reset_index(drop=True)}
+
+
+def run_user(source, output, use_cache=True, use_prophet=False, start_day=None):
+    # Summary of the user of a token (collecting the whole history) or of a cached history file
+    if source.endswith(".parquet"):
+        items = pd.read_parquet(source)
+        user = dict(DEFAULT_USER, id=os.path.basename(source).split("-")[0])
+        defaults = [key for key in DEFAULT_USER if key != "start_day"]
+        found = cache.start_day_of(source, str(items["completed_at"].dt.tz))
+        if found is None and start_day is None:
+            defaults.append("start_day")
+            print(f"Start day of the week of {source} not found, using {user['start_day']} (see --start-day)")
+        user["start_day"] = found or start_day or user["start_day"]
+        summary, frames = summarize(items, user, use_prophet=use_prophet)
+        summary["default_settings"] = {key: user[key] for key in defaults}
+    else:
+        collector = DataCollector(source, use_cache=use_cache)
+        if collector.user is None:
+            raise RuntimeError("the token could not be used to sync")
+        collector.collect_all_items()
+        items, _, history, habits, counts = collector.snapshot()
+        summary, frames = summarize(items, collector.user, history, habits, counts, use_prophet=use_prophet)
+
+    # One JSON summary and one parquet file per table
+    name = str(summary["user_id"])
+    os.makedirs(output, exist_ok=True)
+    with open(os.path.join(output, f"{name}.json"), "w") as f:
+        json.dump(_clean(summary), f, indent=2, default=str, allow_nan=False)
+    for table, frame in frames.items():
+        frame.to_parquet(os.path.join(output, f"{name}-{table}.parquet"), index=False)
+    return name
+
+
+def _clean(value):
+    # Missing numbers are written as null, as NaN is not valid JSON
+    if isinstance(value, dict):
+        return {key: _clean(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_clean(item) for item in value]
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the analytics of many users without the app")
+    parser.add_argument("sources", nargs="*", help="Todoist tokens or cached history files (.parquet)")
+    parser.add_argument("--tokens-file", help="File with one token per line")
+    parser.add_argument("--output", default="reports", help="Folder of the summaries")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of processes")
+    parser.add_argument("--no-cache", action="store_true", help="Collect the whole history again")
+    parser.add_argument("--prophet", action="store_true", help="Recommend goals with the ML forecast")
+    parser.add_argument("--start-day", type=int, choices=range(1, 8),
+                        help="First day of the week (1 is monday) of cached histories whose name does not tell it")
+    args = parser.parse_args()
+
+    sources = list(args.sources)
+    if args.tokens_file:
+        with open(args.tokens_file) as f:
+            sources += [line.strip() for line in f if line.strip()]
+    if not sources:
+        parser.error("no tokens or cached histories given")
+
+    # Each user runs in its own process, failures are reported without stopping the others
+    failures = 0
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(1, args.workers), mp_context=context) as executor:
+        futures = {executor.submit(run_user, source, args.output, not args.no_cache, args.prophet,
+                                   args.start_day): i
+                   for i, source in enumerate(sources)}
+        for future in as_completed(futures):
+            try:
+                print(f"Report of user {future.result()} written to {args.output}")
+            except Exception as e:
+                failures += 1
+                print(f"Report of source #{futures[future] + 1} failed: {e}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import os
+import time
+import threading
+from collections import deque
+from src import metrics
+
+# Priorities, lower values are served first
+FOREGROUND = 0
+BACKGROUND = 1
+
+# Todoist allows around 1,000 requests per user every 15 minutes, the app budget is shared by every user
+token_rate = float(os.environ.get("TODOIST_TOKEN_RATE", 1000 / 900))
+token_burst = float(os.environ.get("TODOIST_TOKEN_BURST", 50))
+app_rate = float(os.environ.get("TODOIST_APP_RATE", 20))
+app_burst = float(os.environ.get("TODOIST_APP_BURST", 100))
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        # Seconds until one token is available
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class Scheduler:
+    def __init__(self, token_rate, token_burst, app_rate, app_burst):
+        self.token_rate = token_rate
+        self.token_burst = token_burst
+        self._condition = threading.Condition()
+        self._app_bucket = TokenBucket(app_rate, app_burst)
+        self._buckets = {}
+        self._queues = {FOREGROUND: {}, BACKGROUND: {}}
+        self._last_served = {}
+        self._served_count = 0
+        self._stats = {priority: {"requests": 0, "total_wait": 0.0, "max_wait": 0.0} for priority in self._queues}
+
+    def acquire(self, key=None, priority=BACKGROUND):
+        # Queue a ticket for this key and wait until it is selected
+        ticket = object()
+        start = time.monotonic()
+        with self._condition:
+            self._queues[priority].setdefault(key, deque()).append(ticket)
+            self._condition.notify_all()
+            while True:
+                delay = self._dispatch(ticket)
+                if delay is None:
+                    break
+                self._condition.wait(timeout=delay)
+
+            # Record wait time and wake up the other tickets
+            wait = time.monotonic() - start
+            stats = self._stats[priority]
+            stats["requests"] += 1
+            stats["total_wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+            self._condition.notify_all()
+        return wait
+
+    def throttle(self, key, seconds):
+        # Empty the bucket of a key that was rate limited by the server
+        with self._condition:
+            bucket = self._bucket(key)
+            bucket.refill(time.monotonic())
+            bucket.tokens = min(bucket.tokens, 1 - seconds * bucket.rate)
+
+    def metrics(self):
+        with self._condition:
+            metrics = {}
+            for priority, queues in self._queues.items():
+                stats = self._stats[priority]
+                name = "foreground" if priority == FOREGROUND else "background"
+                metrics[f"{name}_queue_depth"] = sum(len(queue) for queue in queues.values())
+                metrics[f"{name}_requests"] = stats["requests"]
+                metrics[f"{name}_average_wait_seconds"] = stats["total_wait"] / max(1, stats["requests"])
+                metrics[f"{name}_max_wait_seconds"] = stats["max_wait"]
+            metrics["active_tokens"] = len(self._buckets)
+            return metrics
+
+    def _bucket(self, key):
+        if key not in self._buckets:
+            self._buckets[key] = TokenBucket(self.token_rate, self.token_burst)
+        return self._buckets[key]
+
+    def _dispatch(self, ticket):
+        # Returns None once the ticket is served, otherwise the seconds to wait before trying again
+        now = time.monotonic()
+        self._app_bucket.refill(now)
+        if self._app_bucket.tokens < 1:
+            return self._app_bucket.wait_time()
+
+        # Highest priority first, then the least recently served key with tokens available
+        delay = None
+        for priority in sorted(self._queues):
+            queues = self._queues[priority]
+            for key in sorted(queues, key=lambda k: self._last_served.get(k, -1)):
+                bucket = self._bucket(key) if key is not None else None
+                if bucket is not None:
+                    bucket.refill(now)
+                    if bucket.tokens < 1:
+                        delay = bucket.wait_time() if delay is None else min(delay, bucket.wait_time())
+                        continue
+                if queues[key][0] is not ticket:
+                    # Wait until the selected ticket is served
+                    return 1.0
+                self._serve(priority, key, bucket)
+                return None
+        return delay
+
+    def _serve(self, priority, key, bucket):
+        queue = self._queues[priority][key]
+        queue.popleft()
+        if not queue:
+            del self._queues[priority][key]
+        if bucket is not None:
+            bucket.tokens -= 1
+        self._app_bucket.tokens -= 1
+        self._served_count += 1
+        self._last_served[key] = self._served_count
+
+        # Forget idle keys with full buckets
+        if len(self._buckets) > 1000:
+            for idle_key in [k for k, b in self._buckets.items() if b.tokens >= b.capacity
+                             and all(k not in queues for queues in self._queues.values())]:
+                del self._buckets[idle_key]
+                self._last_served.pop(idle_key, None)
+
+
+# Scheduler shared by every session of this process, its queues and waits are exposed as metrics
+scheduler = Scheduler(token_rate, token_burst, app_rate, app_burst)
+metrics.register("scheduler", scheduler.metrics)
@@ -1,13 +1,21 @@
 import os
+import time
 import asyncio
-import requests
+import threading
 import streamlit as st
+from collections import OrderedDict
+from src import transport
+from src.scheduler import FOREGROUND
 from streamlit.scriptrunner import get_script_run_ctx
-from streamlit.server.server import Server
 
 client_id = os.environ.get("CLIENT_ID")
 client_secret = os.environ.get("CLIENT_SECRET")
 
+# States of the sessions of this process by session id, least recently used first, dropped after being idle
+session_idle_seconds = float(os.environ.get("SESSION_IDLE_SECONDS", 6 * 3600))
+_states = OrderedDict()
+_states_lock = threading.Lock()
+
 
 # SessionState class that has all the information
 # Credits to https://github.com/uiucanh/streamlit-google-oauth
@@ -17,37 +25,54 @@ class SessionState(object):
             setattr(self, key, val)
 
 
-# Get function to get any value from session state
-# Credits to https://github.com/uiucanh/streamlit-google-oauth
+# Get function to get any value from session state, keyed by the id of the session of this script run
 def get_session_state(**kwargs):
     ctx = get_script_run_ctx()
-    this_session = None
-
-    session_info = Server.get_current()._session_info_by_id.values()
-
-    for info in session_info:
-        s = info.session
-        if not hasattr(s, "_main_dg") and s._uploaded_file_mgr == ctx.uploaded_file_mgr:
-            this_session = s
-
-    if this_session is None:
+    if ctx is None:
         raise RuntimeError("Oh noes. Couldn't get your Streamlit Session object. "
                            "Are you doing something fancy with threads?")
 
-    # Got the session object! Now let's attach some state into it.
-    if not hasattr(this_session, "_custom_session_state"):
-        this_session._custom_session_state = SessionState(**kwargs)
-
-    return this_session._custom_session_state
+    now = time.monotonic()
+    with _states_lock:
+        state = _states.pop(ctx.session_id, None)
+        if state is None:
+            state = SessionState(**kwargs)
+        state.last_used = now
+        _states[ctx.session_id] = state
+
+        # Drop the sessions idle for too long, they are the first ones
+        expired = []
+        while _states and now - next(iter(_states.values())).last_used > session_idle_seconds:
+            expired.append(_states.popitem(last=False)[1])
+
+    # Stop the collectors of the expired sessions so their data can be released
+    for old in expired:
+        collector = getattr(old, "collector", None)
+        if collector is not None:
+            collector.stop()
+    return state
+
+
+# Mark the session of this script run as used, every page run calls it so sessions in use do not expire
+def touch_session_state():
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    with _states_lock:
+        state = _states.pop(ctx.session_id, None)
+        if state is not None:
+            state.last_used = time.monotonic()
+            _states[ctx.session_id] = state
 
 
 # Gets the token from todoist oauth
 async def get_token(code):
-    # Post requests for access token
+    # Post requests for access token, sent once as the code can only be exchanged once
     data = {"client_id": client_id,
             "client_secret": client_secret,
             "code": code}
-    response = requests.post("https://todoist.com/oauth/access_token", data=data).json()
+    response = transport.post(f"{transport.auth_url}/oauth/access_token", data=data, priority=FOREGROUND,
+                              retry=False).json()
 
     # Check if response return an error message and return accordingly
     if response.get("error") is None:
@@ -59,7 +84,7 @@ async def get_token(code):
 # Runs the authorization and returns the token or
 def run_auth():
     # Get session token from auth url
-    auth_url = f"https://todoist.com/oauth/authorize?client_id={client_id}&scope=data:read&state={client_secret}"
+    auth_url = f"{transport.auth_url}/oauth/authorize?client_id={client_id}&scope=data:read&state={client_secret}"
     session = get_session_state(token=None)
 
     # If a token is found return it
@@ -78,6 +103,7 @@ def run_auth():
         token = asyncio.run(get_token(code=code))
 
         if token:
+            session.token = token
             return token
 
         st.write(f"""<h1>Page refreshed</h1>
@@ -0,0 +1,131 @@
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Periods that can be sliced from the tasks
+PERIODS = ["week", "month", "quarter", "year"]
+
+
+def period_bounds(period, anchor_date, start_day=1):
+    # First day of the period containing the anchor date and first day of the next one
+    if period == "week":
+        # Weeks are numbered as the iso week of the date moved by the start day of the user
+        shift = timedelta(days=8 - start_day)
+        start = anchor_date + shift
+        start = start - timedelta(days=start.weekday()) - shift
+        return start, start + timedelta(days=7)
+    if period == "month":
+        start = date(anchor_date.year, anchor_date.month, 1)
+        months = 1
+    elif period == "quarter":
+        start = date(anchor_date.year, (anchor_date.month - 1) // 3 * 3 + 1, 1)
+        months = 3
+    elif period == "year":
+        start = date(anchor_date.year, 1, 1)
+        months = 12
+    else:
+        raise ValueError(f"Unknown period {period}, it must be one of {PERIODS}")
+    month = start.month - 1 + months
+    return start, date(start.year + month // 12, month % 12 + 1, 1)
+
+
+class TaskStore:
+    # Snapshot of the tasks shared by every page of a session, it is never modified once created. The tasks are a frame
+    # or an Arrow table memory-mapped from a shared snapshot, read through the mapping only for the columns needed
+    def __init__(self, tasks, version=0, history=None, habits=None, counts=None, start_day=1):
+        self._tasks = tasks
+        self._mapped = isinstance(tasks, pa.Table)
+        self.version = version
+        self.start_day = start_day
+
+        # Positions of the tasks sorted by each date column, built the first time a column is sliced
+        self._orders = {}
+
+        # Reader of the older completed tasks spilled to disk, if any, and index of the completions of every task
+        self.history = history
+        self.habits = habits
+
+        # Completed tasks per day and week with their velocities, and work in progress computed once per day
+        self.counts = counts
+        self._work_in_progress = {}
+
+    def __len__(self):
+        return self._tasks.num_rows if self._mapped else self._tasks.shape[0]
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    @property
+    def columns(self):
+        return self._tasks.column_names if self._mapped else list(self._tasks.columns)
+
+    @property
+    def frame(self):
+        # Whole snapshot without copying (converted from a mapped snapshot), only for code that reads it (aggregates)
+        return self._read(self.columns) if self._mapped else self._tasks
+
+    def column(self, name):
+        # Column without copying, numpy backed columns are read-only so they can not be modified by mistake
+        if self._mapped:
+            return self._read([name])[name]
+        column = self._tasks[name]
+        if isinstance(column.dtype, np.dtype):
+            values = column.values.view()
+            values.flags.writeable = False
+            column = pd.Series(values, index=column.index, name=name, copy=False)
+        return column
+
+    def select(self, columns=None, rows=None):
+        # New frame with only the columns and rows a page needs, pages can add or change columns of it freely
+        columns = self.columns if columns is None else columns
+        if rows is None:
+            if self._mapped:
+                return self._read(columns)
+            return pd.DataFrame({column: self._tasks[column] for column in columns}, index=self._tasks.index)
+        return self._take(columns, np.flatnonzero(np.asarray(rows)))
+
+    def work_in_progress(self, today=None):
+        # Count and average age in days of the active tasks without due date (excluding recurring ones)
+        today = date.today() if today is None else today
+        if today not in self._work_in_progress:
+            added_at = self.column("added_at")
+            active = added_at.notna() & self.column("due_date").isna() & ~self.column("recurring")
+            ages = (pd.Timestamp(today) - added_at[active].dt.tz_localize(None).dt.normalize()).dt.days
+            self._work_in_progress = {today: (int(active.sum()), float(ages.mean()) if not ages.empty else 0.0)}
+        return self._work_in_progress[today]
+
+    def slice(self, period, anchor_date, column="completed_at", columns=None):
+        # Tasks whose date falls in the period (week, month, quarter or year) containing the anchor date
+        order, dates = self._sorted(column)
+        start, end = period_bounds(period, anchor_date, self.start_day)
+        first, last = np.searchsorted(dates, [np.datetime64(start, "ns"), np.datetime64(end, "ns")])
+        return self._take(self.columns if columns is None else columns, np.sort(order[first:last]))
+
+    def _take(self, columns, positions):
+        if self._mapped:
+            return self._read(columns, positions)
+        return pd.DataFrame({column: self._tasks[column].take(positions) for column in columns},
+                            index=self._tasks.index.take(positions))
+
+    def _sorted(self, column):
+        # Positions of the tasks with a date sorted by their local date and time, and those dates
+        if column not in self._orders:
+            dates = self.column(column)
+            if dates.dt.tz is not None:
+                dates = dates.dt.tz_localize(None)
+            dates = dates.to_numpy(dtype="datetime64[ns]")
+            order = np.flatnonzero(~np.isnat(dates))
+            order = order[np.argsort(dates[order], kind="stable")]
+            self._orders[column] = order, dates[order]
+        return self._orders[column]
+
+    def _read(self, columns, positions=None):
+        # Columns (and rows) of a mapped snapshot converted to a frame, indexed by the position of the tasks
+        table = self._tasks.select(columns)
+        if positions is None:
+            return table.to_pandas()
+        frame = table.take(pa.array(positions, type=pa.int64())).to_pandas()
+        frame.index = pd.Index(positions)
+        return frame
@@ -0,0 +1,105 @@
+import os
+import time
+import random
+import threading
+import requests
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from src import metrics
+from src.scheduler import scheduler, BACKGROUND
+
+# Transport settings
+max_connections = int(os.environ.get("TODOIST_MAX_CONNECTIONS", 10))
+max_retries = int(os.environ.get("TODOIST_MAX_RETRIES", 5))
+backoff_seconds = float(os.environ.get("TODOIST_BACKOFF_SECONDS", 0.5))
+max_backoff_seconds = float(os.environ.get("TODOIST_MAX_BACKOFF_SECONDS", 30))
+timeout_seconds = float(os.environ.get("TODOIST_TIMEOUT_SECONDS", 30))
+retry_status_codes = {429, 500, 502, 503, 504}
+
+# Methods retried by default, others (like the exchange of a single use authorization code) are sent once
+idempotent_methods = {"GET", "HEAD", "OPTIONS"}
+
+# Base urls of the todoist api and of its authorization, they can point to a local stand-in for testing
+api_url = os.environ.get("TODOIST_API_URL", "https://api.todoist.com").rstrip("/")
+auth_url = os.environ.get("TODOIST_AUTH_URL", "https://todoist.com").rstrip("/")
+
+# Keep-alive connection pool and worker threads shared by every collector of this process
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=max_connections))
+_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=max_connections))
+_slots = threading.BoundedSemaphore(max_connections)
+executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="todoist")
+
+# Background work waits for the scheduler in its own smaller pool, so loaders throttled by their rate limits can not
+# hold the threads needed by the requests of other sessions
+background_executor = ThreadPoolExecutor(max_workers=max(1, max_connections // 2), thread_name_prefix="todoist-bg")
+
+
+def executor_for(priority):
+    return background_executor if priority == BACKGROUND else executor
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def request(method, url, key=None, priority=BACKGROUND, retry=None, parse=None, **kwargs):
+    # The key (access token) and priority are used to schedule the request within the rate limits. The body of a
+    # successful response is read with parse (into resp.data) while the connection slot is held, so a body cut while
+    # it is read (or that can not be decoded) is retried as a failed request
+    kwargs.setdefault("timeout", timeout_seconds)
+    retries = max_retries if (method.upper() in idempotent_methods if retry is None else retry) else 0
+    for attempt in range(retries + 1):
+        # Send the request using one of the connection slots
+        scheduler.acquire(key, priority)
+        resp = None
+        try:
+            with _slots, metrics.span("http"):
+                resp = _session.request(method, url, **kwargs)
+                if parse is not None and resp.status_code == 200:
+                    resp.data = parse(resp)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError, ValueError) as e:
+            if resp is not None:
+                resp.close()
+            if attempt == retries:
+                raise
+            print(f"Request to {url} failed ({e}), retrying.")
+            time.sleep(_backoff(attempt))
+            continue
+
+        # Return anything that should not be retried
+        if resp.status_code not in retry_status_codes or attempt == retries:
+            return resp
+
+        # Wait as requested by the server or with exponential backoff, releasing the connection of a streamed body
+        retry_after = _retry_after(resp)
+        resp.close()
+        if resp.status_code == 429 and key is not None:
+            scheduler.throttle(key, retry_after)
+        time.sleep(max(retry_after, _backoff(attempt)))
+    return resp
+
+
+def _backoff(attempt):
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(max_backoff_seconds, backoff_seconds * 2 ** attempt))
+
+
+def _retry_after(resp):
+    # Retry-After can be a number of seconds or an HTTP date
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return 0.0
+    try:
+        return min(max_backoff_seconds, max(0.0, float(value)))
+    except ValueError:
+        pass
+    try:
+        return min(max_backoff_seconds, max(0.0, parsedate_to_datetime(value).timestamp() - time.time()))
+    except (TypeError, ValueError):
+        return 0.0
@@ -1,12 +1,89 @@
+import os
+import time
+import threading
+import contextlib
+import pandas as pd
 import streamlit as st
-from src.session import run_auth
+from streamlit.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from src import metrics, plots, forecast
+from src.session import run_auth, get_session_state, touch_session_state
 from src.data import DataCollector
+from src.aggregates import TaskCube
+from src.store import TaskStore
+from src.scheduler import FOREGROUND
 
+# Show the timings of each run in the sidebar (also with ?debug in the url)
+debug_panel = os.environ.get("DEBUG_PANEL", "").lower() in ("1", "true", "yes")
 
-def get_data(token):
-    dc = DataCollector(token)
-    dc.collect_more_items()
-    return dc
+# Time since the app modules were first imported, until the first page of this process is shown
+_started = time.perf_counter()
+_first_run = threading.Event()
+
+
+@contextlib.contextmanager
+def page_run(page):
+    # Time the run of a page for the session (keeping it from expiring), and show its breakdown in the debug panel if
+    # enabled
+    ctx = get_script_run_ctx()
+    session = ctx.session_id if ctx is not None else None
+    touch_session_state()
+    with metrics.run(page, session) as spans:
+        yield
+
+    # After the first page, record the cold start and load the heavy libraries in the background
+    if not _first_run.is_set():
+        _first_run.set()
+        metrics.record("cold start", time.perf_counter() - _started, page, session)
+        plots.warm_up()
+        forecast.warm_up()
+    if debug_panel or "debug" in st.experimental_get_query_params():
+        show_debug_panel(spans, session)
+
+
+def show_debug_panel(spans, session):
+    with st.sidebar.expander("Debug timings"):
+        st.caption(f"This run took {spans[-1]['seconds']:.2f}s")
+        st.table(pd.Series(metrics.breakdown(spans[:-1]), name="seconds", dtype="float"))
+        st.caption("Latest work for this session, including the data loaded in the background")
+        st.dataframe(pd.DataFrame(metrics.recent(session, limit=50), columns=["page", "stage", "seconds"]))
+        st.caption("Requests to todoist waiting in the queues of this process and their wait times")
+        st.table(pd.Series(metrics.gauges(), name="value", dtype="float"))
+
+
+def get_data(token, use_cache=True):
+    # Only active tasks and cached history are loaded here, the rest is loaded in the background
+    return DataCollector(token, use_cache=use_cache)
+
+
+def start_loading(collector):
+    # Load the completed history in a background thread that publishes snapshots of the tasks
+    if collector.completed_count >= collector.user.get("completed_count", float("inf")):
+        return
+
+    def publish():
+        # Skip snapshots of a collector replaced by a newer one
+        if st.session_state.get("collector") is collector:
+            save_collector(collector)
+
+    def load():
+        collector.collect_all_items(on_update=publish)
+
+    thread = threading.Thread(target=load, daemon=True)
+    add_script_run_ctx(thread)
+    thread.start()
+    st.session_state["loader"] = thread
+
+
+def is_loading():
+    return "loader" in st.session_state and st.session_state["loader"].is_alive()
+
+
+def show_progress():
+    # Completed tasks loaded compared to the count reported by todoist
+    loaded = st.session_state["collector"].completed_count
+    total = max(loaded, st.session_state["user"].get("completed_count", loaded))
+    st.sidebar.progress(loaded / total if total > 0 else 1.0)
+    st.sidebar.caption(f"Loaded {loaded:,} of ~{total:,} completed tasks" + (" ⌛" if is_loading() else ""))
 
 
 def is_data_ready():
@@ -17,31 +94,72 @@ def is_data_ready():
     if 'data_is_ready' not in st.session_state:
         refresh_data()
 
-    # If user is authenticated, return True
-    return 'data_is_ready' in st.session_state
+    # If user is authenticated, show the loading progress and return True
+    if 'data_is_ready' in st.session_state:
+        show_progress()
+        return True
+    return False
 
 
-def refresh_data():
+def refresh_data(use_cache=True):
     token = run_auth()
     if token:
+        # Stop the previous collector and wait for its background loading to end, so it can not publish or cache
+        # anything after the new one starts
+        if "collector" in st.session_state:
+            st.session_state["collector"].stop()
+        if is_loading():
+            st.session_state["loader"].join()
         with st.spinner("Getting your data :)"):
-            collector = get_data(token)
-            st.session_state["collector"] = collector
-            st.session_state["tasks"] = collector.items
-            st.session_state["user"] = collector.user
-            st.session_state["collecting"] = collector.collecting
-            st.session_state["data_is_ready"] = True
-            st.info("Your data is loaded, you can start using this app now.")
+            collector = get_data(token, use_cache=use_cache)
+            get_session_state().collector = collector
+            save_collector(collector)
+            start_loading(collector)
+            st.info("Your data is loaded, older tasks will keep loading in the background.")
 
 
 def load_more_data():
     if 'collector' in st.session_state:
         collector = st.session_state["collector"]
         with st.spinner("Getting more data :)"):
-            collector.collect_more_items()
-            st.session_state["collector"] = collector
-            st.session_state["tasks"] = collector.items
-            st.session_state["user"] = collector.user
-            st.session_state["collecting"] = collector.collecting
-            st.session_state["data_is_ready"] = True
+            collector.collect_more_items(priority=FOREGROUND)
+            save_collector(collector)
             st.info("Your data is loaded, you can start using this app now.")
+
+
+def load_all_data():
+    if 'collector' in st.session_state:
+        collector = st.session_state["collector"]
+        with st.spinner("Getting all your history :)"):
+            collector.collect_all_items(priority=FOREGROUND)
+            save_collector(collector)
+            st.info("All your history is loaded.")
+
+
+def sync_data():
+    if 'collector' in st.session_state:
+        collector = st.session_state["collector"]
+        with st.spinner("Syncing your data :)"):
+            collector.sync()
+            save_collector(collector)
+            st.info("Your data is up to date.")
+
+
+def get_cube():
+    # Aggregates are built once per version of the tasks
+    tasks = st.session_state["tasks"]
+    if st.session_state.get("cube_version") != tasks.version:
+        with metrics.span("cube"):
+            st.session_state["cube"] = TaskCube(tasks.frame, tasks.history, tasks.start_day, tasks.habits)
+        st.session_state["cube_version"] = tasks.version
+    return st.session_state["cube"]
+
+
+def save_collector(collector):
+    st.session_state["collector"] = collector
+    # Once the collector is idle pages read the tasks through the shared snapshot, while loading they are in memory
+    idle = not collector.collecting or not is_loading()
+    st.session_state["tasks"] = TaskStore(*collector.publish(idle), start_day=collector.user["start_day"])
+    st.session_state["user"] = collector.user
+    st.session_state["collecting"] = collector.collecting
+    st.session_state["data_is_ready"] = True
@@ -0,0 +1,73 @@
+import json
+import pytest
+from src import parsing
+
+ITEMS = [{"id": "6X7rM8997g3RQmvh", "content": "Café ☕ “quoted” \"escaped\" \\ back\\slash é 😀 tab\t",
+          "priority": 4, "project_id": "2203306141", "labels": ["naïve", "日本"],
+          "added_at": "2022-07-25T10:26:55.802654Z", "checked": False, "is_deleted": False,
+          "due": {"date": "2022-07-30", "is_recurring": True}},
+         {"id": "123456789012", "content": "1e-3 is a number", "priority": 1, "project_id": "220",
+          "added_at": "2022-07-26T00:00:00.000000Z", "due": None},
+         {"id": "3", "content": "", "priority": 12345678901234567890, "project_id": "0", "labels": []}]
+DOCUMENT = {"full_sync": True, "sync_token": "abcé\\\"", "temp_id_mapping": {}, "items": ITEMS,
+            "projects": [{"id": "220", "name": "Ünïcode"}], "count": -12.5e10, "empty": [], "none": None}
+
+
+def chunks(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def expected():
+    data = dict(DOCUMENT)
+    data["items"] = parsing.to_columns(ITEMS)
+    return data
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 64, 1 << 20])
+def test_chunk_boundaries(size):
+    # Every split of numbers, escapes and multibyte characters is covered with chunks of one byte
+    body = json.dumps(DOCUMENT, ensure_ascii=False, indent=1).encode("utf-8")
+    assert parsing.parse(chunks(body, size)) == expected()
+
+
+@pytest.mark.parametrize("size", [1, 4, 1 << 20])
+def test_ascii_escapes(size):
+    body = json.dumps(DOCUMENT).encode("utf-8")
+    assert parsing.parse(chunks(body, size)) == expected()
+
+
+def test_number_at_chunk_end():
+    # A number cut by the end of a chunk is read again with the next one
+    assert parsing.parse([b'{"count": 12', b'345, "items": []}']) == {"count": 12345, "items": {}}
+    assert parsing.parse([b'{"count": -1.', b'5e', b'3}']) == {"count": -1500.0}
+
+
+def test_items_as_columns():
+    # Active items are identified by their id, keys missing from every item are left out
+    columns = parsing.parse([json.dumps({"items": ITEMS}).encode()])["items"]
+    assert parsing.count(columns) == 3
+    assert columns["task_id"] == ["6X7rM8997g3RQmvh", "123456789012", "3"]
+    assert columns["due_date"] == ["2022-07-30", None, None]
+    assert columns["recurring"] == [True, None, None]
+    assert "completed_at" not in columns
+    assert parsing.take(columns, [False, True, False])["content"] == ["1e-3 is a number"]
+
+
+def test_completed_items():
+    # Completed items keep the id of their task, and have no due object
+    body = json.dumps({"items": [{"task_id": "7", "id": "99", "completed_at": "2022-07-26T00:00:00Z"}],
+                       "projects": {}}).encode()
+    columns = parsing.parse(chunks(body, 2))["items"]
+    assert columns == {"task_id": ["7"], "completed_at": ["2022-07-26T00:00:00Z"]}
+
+
+@pytest.mark.parametrize("cut", [1, 10, 50, 200, -40, -2, -1])
+def test_truncated_body(cut):
+    body = json.dumps(DOCUMENT, ensure_ascii=False).encode("utf-8")
+    with pytest.raises(ValueError):
+        parsing.parse(chunks(body[:cut], 3))
+
+
+def test_not_an_object():
+    with pytest.raises(ValueError):
+        parsing.parse([b'["items"]'])
@@ -0,0 +1,124 @@
+import random
+import threading
+from datetime import timedelta
+import pandas as pd
+import pytest
+from src.data import DataCollector
+
+TIMEZONES = ["UTC", "Europe/Madrid", "America/Mexico_City", "Asia/Kolkata", "Pacific/Auckland"]
+PROJECTS = [{"id": "p1", "name": "Inbox", "color": "grey"}, {"id": "p2", "name": "Work", "color": "red"},
+            {"id": "p3", "name": "", "color": "blue"}]
+
+
+def row_wise(items, projects, user, previous):
+    # Previous implementation of DataCollector._preprocess_data, applied to one batch
+    if type(projects) == list:
+        projects = pd.DataFrame(projects).rename(columns={"id": "project_id", "name": "project_name"})
+    else:
+        projects = pd.DataFrame(projects.values(), index=projects.keys()).reset_index()
+        projects = projects.rename(columns={"index": "project_id"})
+        projects["project_name"] = projects.apply(lambda x: x["project_id"] if x["name"] == '' else x["name"],
+                                                  axis=1)
+    projects = projects[["project_id", "project_name", "color"]]
+    items = pd.DataFrame(items)
+    if "task_id" not in items.columns.values.tolist():
+        items = items.rename(columns={"id": "task_id"})
+    if "due" in items.columns.values.tolist():
+        items["due_date"] = items["due"].apply(lambda x: x["date"] if x else None)
+        items["recurring"] = items["due"].apply(lambda x: x["is_recurring"] if x else False)
+    else:
+        items = items.merge(previous[["task_id", "recurring"]].drop_duplicates(), how="left", on="task_id")
+    if "priority" not in items.columns.values.tolist():
+        items["priority"] = 0
+    items["priority"] = items["priority"].apply(lambda x: "Priority {}".format(x))
+    column_names = ["task_id", "content", "priority", "project_id", "recurring",
+                    "labels", "added_at", "due_date", "completed_at"]
+    for column in column_names:
+        if column not in items.columns.values.tolist():
+            items[column] = None
+    items = items[column_names]
+    items = items.merge(projects, how="left", on="project_id")
+    items.drop(["project_id"], axis=1, inplace=True)
+    timezone = user["tz_info"]["timezone"]
+    for column in ["completed_at", "added_at", "due_date"]:
+        items[column] = pd.to_datetime(items[column], utc=True).map(lambda x: x.tz_convert(timezone))
+    start_day = 8 - user["start_day"]
+    for prefix, column in [("completed", "completed_at"), ("due", "due_date")]:
+        items[f"{prefix}_year"] = items[column].dt.year
+        items[f"{prefix}_quarter"] = items[column].dt.quarter
+        items[f"{prefix}_month"] = items[column].dt.month
+        items[f"{prefix}_week"] = items[column].dt.date.map(
+            lambda x: None if pd.isnull(x) else (x + timedelta(days=start_day)).isocalendar()[1])
+        items[f"{prefix}_day"] = items[column].dt.day
+    items["recurring"] = items["recurring"].astype("bool")
+    return items
+
+
+def active_items(rng, count):
+    items = []
+    for i in range(count):
+        due = None
+        if rng.random() < 0.6:
+            due = {"date": (pd.Timestamp("2022-12-20") + pd.Timedelta(hours=rng.randrange(24 * 60))).isoformat(),
+                   "is_recurring": rng.random() < 0.3}
+        items.append({"id": str(1000 + i), "content": f"Task {i}", "priority": rng.randint(1, 4),
+                      "project_id": rng.choice(PROJECTS)["id"], "labels": rng.sample(["a", "b", "c"], rng.randint(0, 2)),
+                      "added_at": (pd.Timestamp("2022-01-01", tz="UTC") +
+                                   pd.Timedelta(minutes=rng.randrange(525600))).isoformat(),
+                      "due": due, "checked": False, "is_deleted": False})
+    return items
+
+
+def completed_items(rng, count):
+    # Completed items have no priority, labels or due date, some of them are known active tasks
+    return [{"task_id": str(rng.choice([1000 + rng.randrange(20), 5000 + i])), "content": f"Done {i}",
+             "project_id": rng.choice(PROJECTS)["id"],
+             "completed_at": (pd.Timestamp("2021-12-25", tz="UTC") +
+                              pd.Timedelta(minutes=rng.randrange(525600))).isoformat()} for i in range(count)]
+
+
+def collector(user):
+    # Collector with the state used to preprocess, without syncing
+    collector = DataCollector.__new__(DataCollector)
+    collector.user = user
+    collector._lock = threading.Lock()
+    collector._chunks = []
+    collector._recurring = pd.Series(dtype="bool")
+    return collector
+
+
+def normalize(items):
+    # Values compared regardless of the compact dtypes of the vectorized version
+    items = items.copy()
+    items["task_id"] = items["task_id"].astype(str)
+    for column in ["content", "priority", "project_name", "color"]:
+        items[column] = items[column].astype(object).where(items[column].notna(), None)
+    for column in items.columns:
+        if column.endswith(("_year", "_quarter", "_month", "_week", "_day")):
+            items[column] = items[column].astype("Int64")
+    return items.reset_index(drop=True)
+
+
+@pytest.mark.parametrize("timezone", TIMEZONES)
+@pytest.mark.parametrize("start_day", [1, 4, 7])
+def test_matches_row_wise(timezone, start_day):
+    rng = random.Random(f"{timezone}-{start_day}")
+    user = {"tz_info": {"timezone": timezone}, "start_day": start_day}
+    active, completed = active_items(rng, 200), completed_items(rng, 300)
+
+    new = collector(user)
+    new._preprocess_data(active, PROJECTS)
+    new._preprocess_data(completed, {project["id"]: project for project in PROJECTS})
+    new_active, new_completed = new._chunks
+
+    old_active = row_wise(active, PROJECTS, user, None)
+    old_completed = row_wise(completed, {project["id"]: project for project in PROJECTS}, user, old_active)
+
+    # Labels were joined later by the old code, the rest of the columns must match
+    old_active["labels"] = old_active["labels"].str.join(", ")
+    old_completed["labels"] = ""
+    for old, new in [(old_active, new_active), (old_completed, new_completed)]:
+        new = normalize(new)
+        old = normalize(old)[list(new.columns)]
+        new["labels"] = new["labels"].astype(object)
+        pd.testing.assert_frame_equal(new, old, check_dtype=False, check_categorical=False)